@@ -2,7 +2,12 @@
 
 import json
 from pathlib import Path
-from utils.auth import sha256_encrypt, bcrypt_hash, get_system_info, store_log
+from utils.auth import (
+    sha256_encrypt,
+    bcrypt_hash,
+    get_system_info,
+    fingerprint_digest,
+)
 from utils.helpers import green, red, blue, reset, typing_effect, input_quit_handle
 
 # Paths for storing data:
@@ -55,6 +60,8 @@ def create_admin():
     }
 
     system_info = get_system_info()
+    # Indexed digest login looks the machine up by
+    system_info["fingerprint"] = fingerprint_digest(system_info)
 
     with open(ADMIN_JSON, "w") as admin_file:
         json.dump(encrypted_admin_data, admin_file, indent=4)
@@ -0,0 +1,60 @@
+# Async twin of backend.py (Quart + Motor + redis.asyncio).
+# Same routes and response shapes; run with: hypercorn backend_async:app
+import asyncio
+from quart import Quart, jsonify, request
+from connection.connect_db import ensure_indexes
+from connection.connect_async import close_async_clients
+from web.handlers import ROUTES, WebRequest
+from web.async_io import async_io
+from utils.session import start_session_listener
+
+
+app = Quart(__name__)
+
+
+@app.before_serving
+async def startup():
+    await asyncio.to_thread(ensure_indexes)
+    # Subscribing blocks on Redis; keep it off the event loop
+    await asyncio.to_thread(start_session_listener)
+
+
+@app.after_serving
+async def shutdown():
+    await close_async_clients()
+
+
+@app.route("/")
+async def home():
+    return "Quart server is running!"
+
+
+def _view(handler):
+
+    # Quart view for a shared handler (web/handlers.py)
+    async def view(**params):
+        req = WebRequest(
+            request.method,
+            await request.get_json(silent=True) or {},
+            request.args,
+            request.headers,
+        )
+        body, status_code, headers = await handler(async_io, req, **params)
+        return jsonify(body), status_code, headers
+
+    return view
+
+
+for rule, methods, handler in ROUTES:
+    app.add_url_rule(rule, handler.__name__, _view(handler), methods=methods)
+
+
+if __name__ == "__main__":
+    import logging
+
+    logging.basicConfig(
+        filename="flask_server.log",
+        level=logging.DEBUG,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    app.run(port=5000)
@@ -0,0 +1,109 @@
+# Throughput of the Flask dev server vs. serve.py (gunicorn, pre-forked).
+#
+#   python bench_server.py [--requests 5000] [--concurrency 32] [--path /]
+#
+# Each server is started on its own port, warmed up, then hit by
+# `concurrency` keep-alive clients; requests/sec and latency are printed.
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+DEV_PORT = 5101
+PROD_PORT = 5102
+
+SERVERS = {
+    "flask dev server": (
+        [
+            sys.executable,
+            "-c",
+            "from backend import app; "
+            f"app.run(port={DEV_PORT}, debug=True, use_reloader=False)",
+        ],
+        DEV_PORT,
+        {},
+    ),
+    "serve.py (gunicorn)": (
+        [sys.executable, "serve.py"],
+        PROD_PORT,
+        {"WEB_BIND": f"127.0.0.1:{PROD_PORT}"},
+    ),
+}
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client(port, path, count):
+    latencies = []
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    for _ in range(count):
+        started = time.perf_counter()
+        conn.request("GET", path)
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies
+
+
+def run_load(port, path, requests, concurrency):
+    per_client = max(1, requests // concurrency)
+    client(port, path, 50)  # warm up
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(
+            lambda _: client(port, path, per_client), range(concurrency)
+        )
+        latencies = sorted(lat for chunk in results for lat in chunk)
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    for name, (command, port, env) in SERVERS.items():
+        process = subprocess.Popen(
+            command,
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        try:
+            if not wait_for_port(port):
+                print(f"{name}: did not start")
+                continue
+            stats = run_load(port, args.path, args.requests, args.concurrency)
+            print(
+                f"{name:22} {stats['rps']:8.0f} req/s  "
+                f"p50 {stats['p50_ms']:6.2f} ms  p99 {stats['p99_ms']:6.2f} ms"
+            )
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Cold-start cost of the CLI (main.py).
+#
+#   python bench_startup.py                    -X importtime summary
+#   python bench_startup.py --top 25 --module backend
+#   python bench_startup.py --check            exit 1 when over budget
+#
+# --check fails when importing the module takes longer than
+# STARTUP_BUDGET_MS (best of --runs fresh interpreters) or when it pulls in
+# any of HEAVY_MODULES, which must only load on first use.
+import os
+import sys
+import argparse
+import subprocess
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "100"))
+
+HEAVY_MODULES = [
+    "requests",
+    "bcrypt",
+    "pydantic",
+    "pymongo",
+    "bson",
+    "redis",
+    "flask",
+    "jwt",
+    "itsdangerous",
+]
+
+
+def _python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def import_times(module):
+
+    # Parses `-X importtime` lines:
+    #   import time: self [us] | cumulative | imported package
+    result = _python("-X", "importtime", "-c", f"import {module}")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        # One space after the "|", then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), name.strip(), depth))
+    return rows
+
+
+def cold_start_ms(module, runs=5):
+
+    # Best of `runs` fresh interpreters; interpreter startup itself is not
+    # counted, only the import of `module`
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - started) * 1000)"
+    )
+    timings = []
+    for _ in range(runs):
+        result = _python("-c", code)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def heavy_imports(module):
+
+    result = _python("-c", f"import sys, {module}; print(' '.join(sys.modules))")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    loaded = {name.split(".")[0] for name in result.stdout.split()}
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def summary(module, top):
+
+    rows = import_times(module)
+    total_ms = sum(row[0] for row in rows) / 1000
+    print(f"import {module}: {total_ms:.1f} ms in {len(rows)} modules\n")
+
+    print(f"Top {top} packages by cumulative time:")
+    packages = sorted((row for row in rows if row[3] == 0), key=lambda row: -row[1])
+    for self_us, cumulative_us, name, _ in packages[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    print(f"\nTop {top} modules by own time:")
+    for self_us, _, name, _ in sorted(rows, key=lambda row: -row[0])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+
+def check(module, budget_ms, runs):
+
+    failed = False
+    elapsed_ms = cold_start_ms(module, runs)
+    if elapsed_ms > budget_ms:
+        failed = True
+        print(f"FAIL import {module}: {elapsed_ms:.1f} ms > budget {budget_ms} ms")
+    else:
+        print(f"ok   import {module}: {elapsed_ms:.1f} ms (budget {budget_ms} ms)")
+
+    heavy = heavy_imports(module)
+    if heavy:
+        failed = True
+        print(f"FAIL import {module} loads {', '.join(heavy)} eagerly")
+    else:
+        print(f"ok   import {module} loads none of {', '.join(HEAVY_MODULES)}")
+    return 1 if failed else 0
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Startup time of the CLI")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        if args.check:
+            sys.exit(check(args.module, args.budget_ms, args.runs))
+        summary(args.module, args.top)
+    except RuntimeError as e:
+        print(f"import {args.module} failed: {e}")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Async connections (Motor / redis.asyncio) for the async backend
+import logging
+import redis.asyncio as aioredis
+from motor.motor_asyncio import AsyncIOMotorClient
+from connection.connect_db import (
+    MONGO_URI,
+    MONGO_DBNAME,
+    MONGO_COLLECTIONS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
+from connection.connect_redis import (
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_DB,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_CONNECT_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_RETRY_ON_TIMEOUT,
+)
+from utils.helpers import green, red, reset
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Both clients bind to the running event loop, so they are created on first
+# use from inside it and closed with close_async_clients() on shutdown.
+_motor_client = None
+_redis_clients = {}
+
+
+def get_async_db():
+
+    global _motor_client
+    if _motor_client is None:
+        _motor_client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        )
+        logger.info(green + "Motor client created" + reset)
+    return _motor_client[MONGO_DBNAME]
+
+
+def get_async_collection(collection_key: str):
+
+    collection_name = MONGO_COLLECTIONS.get(collection_key)
+    if not collection_name:
+        logger.error(red + f"Collection key '{collection_key}' not found." + reset)
+        return None
+    return get_async_db()[collection_name]
+
+
+def get_async_redis(decode_responses=True):
+
+    client = _redis_clients.get(decode_responses)
+    if client is None:
+        pool = aioredis.ConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            decode_responses=decode_responses,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+            retry_on_timeout=REDIS_RETRY_ON_TIMEOUT,
+        )
+        client = _redis_clients[decode_responses] = aioredis.Redis(
+            connection_pool=pool
+        )
+    return client
+
+
+async def close_async_clients():
+
+    global _motor_client
+    if _motor_client is not None:
+        _motor_client.close()
+        _motor_client = None
+    for client in list(_redis_clients.values()):
+        await client.connection_pool.disconnect()
+    _redis_clients.clear()
@@ -1,9 +1,13 @@
 # Setting up the connection
 import os
+import time
 import logging
-from pymongo import MongoClient
+import threading
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import ConnectionPoolListener
 from dotenv import load_dotenv
-from utils.helpers import reset, green, red
+from utils.helpers import reset, green, blue, red
 
 load_dotenv()
 
@@ -14,8 +18,92 @@ MONGO_COLLECTIONS = {
     "admin": os.getenv("MONGO_ADMIN"),
     "admin_log": os.getenv("MONGO_ADLOG"),
     "audit_log": os.getenv("MONGO_AUDIT"),
+    "audit_rollup": os.getenv("MONGO_AUDIT_ROLLUP", "audit_rollup"),
 }
 
+# Audit events older than this are removed (0 = keep forever)
+AUDIT_TTL_DAYS = int(os.getenv("AUDIT_TTL_DAYS", "0"))
+
+# Store audit_log as a time-series collection (timestamp / meta.user_id,action)
+AUDIT_TIMESERIES = os.getenv("AUDIT_TIMESERIES", "false").lower() == "true"
+AUDIT_META_FIELDS = ("user_id", "action")
+
+
+def audit_field(name: str) -> str:
+
+    # Where an audit field lives in storage (meta fields nest under "meta")
+    if AUDIT_TIMESERIES and name in AUDIT_META_FIELDS:
+        return f"meta.{name}"
+    return name
+
+
+# Time-series collections expire by collection option, not by TTL index
+_audit_ttl_index = (
+    [
+        IndexModel(
+            [("timestamp", ASCENDING)],
+            name="timestamp_ttl",
+            expireAfterSeconds=AUDIT_TTL_DAYS * 86400,
+        )
+    ]
+    if AUDIT_TTL_DAYS and not AUDIT_TIMESERIES
+    else []
+)
+
+# Indexes per collection key, created idempotently by ensure_indexes()
+MONGO_INDEXES = {
+    "admin": [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "admin_log": [
+        IndexModel([("fingerprint", ASCENDING)], name="fingerprint"),
+    ],
+    "audit_log": [
+        IndexModel(
+            [
+                (audit_field("user_id"), ASCENDING),
+                ("timestamp", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="user_id_timestamp",
+        ),
+        IndexModel(
+            [
+                (audit_field("action"), ASCENDING),
+                ("timestamp", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="action_timestamp",
+        ),
+        IndexModel(
+            [("timestamp", DESCENDING), ("_id", DESCENDING)], name="timestamp_id"
+        ),
+    ]
+    + _audit_ttl_index,
+    "audit_rollup": [
+        IndexModel([("hour", DESCENDING), ("action", ASCENDING)], name="hour_action"),
+    ],
+}
+
+# Newest first, _id breaks ties so keyset pagination is stable
+AUDIT_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Known query shapes (collection key, filter, sort) checked by check_indexes()
+QUERY_SHAPES = [
+    ("admin", {"name": ""}, None),
+    ("admin", {"email": ""}, None),
+    ("admin_log", {"fingerprint": ""}, None),
+    ("audit_log", {audit_field("user_id"): ""}, AUDIT_SORT),
+    ("audit_log", {audit_field("action"): ""}, AUDIT_SORT),
+    ("audit_log", {"timestamp": {"$gte": 0}}, AUDIT_SORT),
+]
+
+# Pool settings (one client per process, shared by all queries)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
 # Setup logger
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -23,12 +111,168 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class PoolStats(ConnectionPoolListener):
+    # Counts pool events so we can see how the shared client behaves under load.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connections_created": self.created,
+                "connections_closed": self.closed,
+                "connections_open": self.created - self.closed,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(
+                    self.wait_time_total * 1000 / self.checkouts, 3
+                )
+                if self.checkouts
+                else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+    def _wait_done(self):
+        # Check-out started/finished events fire on the same thread.
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._wait_done()
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_time_total += waited
+
+    def connection_checked_out(self, event):
+        waited = self._wait_done()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+
+pool_stats = PoolStats()
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _forget_client():
+    # Runs in a forked child: the parent's sockets and monitor threads are not
+    # usable here, so drop the reference and let the child build its own client.
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+    pool_stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client)
+
+
+def get_client():
+
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+        if _client_pid is not None and _client_pid != os.getpid():
+            _forget_client()
+        try:
+            _client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[pool_stats],
+            )
+            _client_pid = os.getpid()
+            logger.info(
+                green
+                + "MongoDB client created "
+                + f"(pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})"
+                + reset
+            )
+            return _client
+        except Exception as e:
+            logger.error(red + f"Failed to connect to MongoDB: {e}" + reset)
+            raise e
+
+
+def close_client():
+
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            logger.info(blue + "MongoDB client closed" + reset)
+        _client = None
+        _client_pid = None
+
+
+def get_pool_stats():
+
+    return pool_stats.snapshot()
+
+
 def get_db():
 
     try:
-        client = MongoClient(MONGO_URI)
-        db = client[MONGO_DBNAME]
-        logger.info(green + f"Connected to database: {db.name}" + reset)
+        db = get_client()[MONGO_DBNAME]
         return db
     except Exception as e:
         logger.error(red + f"Failed to connect to MongoDB: {e}" + reset)
@@ -56,3 +300,153 @@ def get_collection(collection_key: str):
         return None
 
     return collection
+
+
+def _sync_audit_ttl_index(db, name):
+
+    # create_indexes() never changes an existing index: a new AUDIT_TTL_DAYS
+    # would fail with IndexOptionsConflict (and take the other audit_log
+    # indexes with it), so retention is updated in place with collMod
+    try:
+        existing = db[name].index_information().get("timestamp_ttl")
+        if existing is None:
+            return
+        if not AUDIT_TTL_DAYS:
+            db[name].drop_index("timestamp_ttl")
+            logger.info(green + f"Dropped TTL index on {name}" + reset)
+            return
+        expire = AUDIT_TTL_DAYS * 86400
+        if existing.get("expireAfterSeconds") != expire:
+            db.command(
+                "collMod",
+                name,
+                index={"name": "timestamp_ttl", "expireAfterSeconds": expire},
+            )
+            logger.info(
+                green
+                + f"Audit retention on {name} set to {AUDIT_TTL_DAYS} day(s)"
+                + reset
+            )
+    except PyMongoError as e:
+        logger.error(red + f"Failed to update TTL index on {name}: {e}" + reset)
+
+
+def ensure_audit_collection():
+
+    # Creates audit_log as a time-series collection, or updates its retention
+    db = get_db()
+    if not AUDIT_TIMESERIES:
+        _sync_audit_ttl_index(db, MONGO_COLLECTIONS["audit_log"])
+        return
+    name = MONGO_COLLECTIONS["audit_log"]
+    expire = {"expireAfterSeconds": AUDIT_TTL_DAYS * 86400} if AUDIT_TTL_DAYS else {}
+    try:
+        existing = next(db.list_collections(filter={"name": name}), None)
+        if existing is None:
+            db.create_collection(
+                name,
+                timeseries={
+                    "timeField": "timestamp",
+                    "metaField": "meta",
+                    "granularity": "seconds",
+                },
+                **expire,
+            )
+            logger.info(green + f"Created time-series collection {name}" + reset)
+        elif existing.get("type") != "timeseries":
+            logger.warning(
+                blue
+                + f"{name} is a regular collection; migrate it to time-series "
+                + "before enabling AUDIT_TIMESERIES"
+                + reset
+            )
+        else:
+            db.command(
+                "collMod",
+                name,
+                expireAfterSeconds=expire.get("expireAfterSeconds", "off"),
+            )
+    except PyMongoError as e:
+        logger.error(red + f"Failed to set up time-series {name}: {e}" + reset)
+
+
+def ensure_indexes():
+
+    # Safe to run on every start: existing identical indexes are a no-op
+    ensure_audit_collection()
+    created = {}
+    for collection_key, indexes in MONGO_INDEXES.items():
+        if not indexes:
+            continue
+        collection = get_collection(collection_key)
+        if collection is None:
+            continue
+        try:
+            created[collection_key] = collection.create_indexes(indexes)
+            logger.info(
+                green
+                + f"Indexes ensured on {collection.name}: {created[collection_key]}"
+                + reset
+            )
+        except PyMongoError as e:
+            logger.error(
+                red + f"Failed to ensure indexes on {collection_key}: {e}" + reset
+            )
+    return created
+
+
+def _plan_stages(plan):
+
+    stages = [plan.get("stage")]
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages += _plan_stages(plan[child])
+    for sub in plan.get("inputStages", []):
+        stages += _plan_stages(sub)
+    return stages
+
+
+def check_indexes():
+
+    # Explain every known query shape and flag the ones doing a COLLSCAN
+    results = []
+    for collection_key, query, sort in QUERY_SHAPES:
+        collection = get_collection(collection_key)
+        if collection is None:
+            continue
+        try:
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = cursor.explain()["queryPlanner"]["winningPlan"]
+            stages = _plan_stages(plan)
+            collscan = "COLLSCAN" in stages
+            results.append(
+                {
+                    "collection": collection_key,
+                    "query": query,
+                    "sort": sort,
+                    "stages": stages,
+                    "collscan": collscan,
+                }
+            )
+            color = red if collscan else green
+            logger.info(
+                color
+                + f"{collection_key} {query} sort={sort}: {' <- '.join(stages)}"
+                + reset
+            )
+        except PyMongoError as e:
+            logger.error(
+                red + f"Failed to explain {collection_key} {query}: {e}" + reset
+            )
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    ensure_indexes()
+    if "--check" in sys.argv:
+        flagged = [r for r in check_indexes() if r["collscan"]]
+        sys.exit(1 if flagged else 0)
@@ -2,15 +2,23 @@
 import redis
 import os
 import logging
+import threading
 from dotenv import load_dotenv
 from utils.helpers import reset, green, red
 
 load_dotenv()
 
 # Redis connection settings
-REDIS_HOST = os.getenv("REDIS_HOST")
-REDIS_PORT = int(os.getenv("REDIS_PORT"))
-REDIS_DB = int(os.getenv("REDIS_DB"))
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+
+# Pool settings
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRY_ON_TIMEOUT = os.getenv("REDIS_RETRY_ON_TIMEOUT", "true").lower() == "true"
 
 # Setup logger
 logging.basicConfig(
@@ -18,22 +26,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(decode_responses=True):
+
+    # One pool per response mode, created on first use (redis-py resets the
+    # pool itself after a fork)
+    pool = _pools.get(decode_responses)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = redis.ConnectionPool(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                db=REDIS_DB,
+                decode_responses=decode_responses,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                retry_on_timeout=REDIS_RETRY_ON_TIMEOUT,
+            )
+            _pools[decode_responses] = pool
+            logger.info(
+                green
+                + f"Redis pool created for {REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+                + reset
+            )
+    return pool
+
+
+class LazyRedis:
+    # Stands in for a redis.Redis client; the client (and its pool) is only
+    # built on first attribute access, so importing this module is free.
+
+    def __init__(self, decode_responses=True):
+        self._decode_responses = decode_responses
+        self._client = None
+
+    def _get(self):
+        if self._client is None:
+            self._client = redis.Redis(
+                connection_pool=get_pool(self._decode_responses)
+            )
+        return self._client
+
+    def reset(self):
+        self._client = None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
 # Setup Redis connection
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST"),
-    port=os.getenv("REDIS_PORT"),
-    db=0,
-    decode_responses=True,
-)
+redis_client = LazyRedis(decode_responses=True)
+
+# Raw bytes client for binary cache payloads
+redis_binary_client = LazyRedis(decode_responses=False)
+
+
+def reset_pools():
+
+    # Drop pools and clients, e.g. in a freshly forked worker, so every
+    # process opens its own sockets
+    with _pools_lock:
+        _pools.clear()
+    redis_client.reset()
+    redis_binary_client.reset()
 
 
 def get_redis_client():
 
+    # No network here; connections are opened when a command runs
+    return redis_client
+
+
+def ping_redis():
+
     try:
-        # Test connection
         redis_client.ping()
         logger.info(green + "Connected to Redis!" + reset)
-        return redis_client
+        return True
     except redis.ConnectionError as e:
         logger.error(red + f"Failed to connect to Redis: {e}" + reset)
-        raise e
+        return False
+
+
+def get_pool_stats():
+
+    stats = {}
+    for decode_responses, pool in list(_pools.items()):
+        in_use = len(getattr(pool, "_in_use_connections", ()))
+        available = len(getattr(pool, "_available_connections", ()))
+        stats["text" if decode_responses else "binary"] = {
+            "max_connections": pool.max_connections,
+            "created": getattr(pool, "_created_connections", in_use + available),
+            "in_use": in_use,
+            "available": available,
+        }
+    return stats
@@ -1,18 +1,199 @@
+import os
+import queue
+import base64
+import atexit
 import logging
+import threading
 from datetime import datetime
-from db.db_operations import find_documents, insert_document
-from utils.helpers import red, green, reset
+from bson import ObjectId
+from dotenv import load_dotenv
+from connection.connect_db import (
+    AUDIT_SORT,
+    AUDIT_TIMESERIES,
+    AUDIT_META_FIELDS,
+    audit_field,
+)
+from db.db_operations import insert_document, insert_documents, iter_documents
+from utils.helpers import red, green, blue, reset
 
 #
 # ---- For the audit logs --->
 #
 
+load_dotenv()
+
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "true").lower() == "true"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+# What to do when the queue is full: block, drop_newest or drop_oldest
+AUDIT_QUEUE_POLICY = os.getenv("AUDIT_QUEUE_POLICY", "block")
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.5"))
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
 
+class AuditWriter:
+    # Buffers audit events and writes them with insert_many from a background
+    # thread, so logging an event never waits on MongoDB.
+
+    def __init__(
+        self,
+        maxsize=AUDIT_QUEUE_SIZE,
+        batch_size=AUDIT_BATCH_SIZE,
+        flush_interval=AUDIT_FLUSH_INTERVAL,
+        policy=AUDIT_QUEUE_POLICY,
+        block_timeout=AUDIT_BLOCK_TIMEOUT,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        # (Re)start the worker lazily, also in a forked child
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="audit-writer", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, event):
+
+        self._ensure_started()
+        try:
+            if self.policy == "block":
+                self._queue.put(event, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            pass
+
+        if self.policy == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(event)
+                self.dropped += 1
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+
+        self.dropped += 1
+        # Events arrive in storage shape; time-series keeps action under meta
+        action = event.get("meta", event).get("action")
+        logger.warning(blue + f"Audit queue full, dropped: {action}" + reset)
+        return False
+
+    def _drain(self, first=None, limit=None):
+
+        limit = limit or self.batch_size
+        batch = [first] if first is not None else []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+
+        if not batch:
+            return
+        report = insert_documents("audit_log", batch, batch_size=self.batch_size)
+        self.written += report["inserted"]
+        self.failed += len(batch) - report["inserted"]
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to fill the batch before writing
+            batch = self._drain(first)
+            if len(batch) < self.batch_size:
+                self._stop.wait(min(0.05, self.flush_interval))
+                batch += self._drain(limit=self.batch_size - len(batch))
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(red + f"Failed to write audit batch: {e}" + reset)
+
+    def flush(self):
+
+        # Write whatever is queued right now on the calling thread
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(red + f"Failed to flush audit log on exit: {e}" + reset)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.close)
+
+
+def _to_storage(event):
+
+    # Time-series: user_id / action become the meta field
+    if not AUDIT_TIMESERIES:
+        return event
+    stored = {k: v for k, v in event.items() if k not in AUDIT_META_FIELDS}
+    stored["meta"] = {field: event.get(field) for field in AUDIT_META_FIELDS}
+    return stored
+
+
+def _from_storage(document):
+
+    if "meta" not in document:
+        return document
+    event = {k: v for k, v in document.items() if k != "meta"}
+    event.update(document["meta"] or {})
+    return event
+
+
 def log_audit_event(user_id, email, action, details=None):
 
     try:
@@ -23,7 +204,11 @@ def log_audit_event(user_id, email, action, details=None):
             "details": details or {},
             "timestamp": datetime.now(),
         }
-        insert_document("audit_log", audit_log)
+        audit_log = _to_storage(audit_log)
+        if AUDIT_ASYNC:
+            audit_writer.submit(audit_log)
+        else:
+            insert_document("audit_log", audit_log)
         logger.info(
             green + f"Audit log created for user {email}, action: {action}" + reset
         )
@@ -31,12 +216,154 @@ def log_audit_event(user_id, email, action, details=None):
         logger.error(red + f"Failed to log audit event: {e}" + reset)
 
 
-def get_audit_logs(user_id=None, action=None):
+def _audit_filter(user_id=None, action=None, since=None, until=None):
+
     query = {}
     if user_id:
-        query["user_id"] = user_id
+        query[audit_field("user_id")] = user_id
     if action:
-        query["action"] = action
+        query[audit_field("action")] = action
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lt"] = until
+    return query
+
+
+def encode_cursor(document):
+
+    # Opaque page token: position of the last row of the page
+    raw = f"{document['timestamp'].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, _, object_id = raw.partition("|")
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _after(query, cursor):
+
+    # Keyset condition for rows strictly after (timestamp, _id) in sort order
+    timestamp, object_id = decode_cursor(cursor)
+    return {
+        "$and": [
+            query,
+            {
+                "$or": [
+                    {"timestamp": {"$lt": timestamp}},
+                    {"timestamp": timestamp, "_id": {"$lt": object_id}},
+                ]
+            },
+        ]
+    }
+
+
+def _with_sort_fields(projection):
+
+    # The cursor needs timestamp and _id, whatever the caller projects
+    if not projection:
+        return projection
+    projection = {audit_field(key): value for key, value in projection.items()}
+    if any(value for key, value in projection.items() if key != "_id"):
+        return {**projection, "timestamp": 1, "_id": 1}
+    # Exclusion projection: just make sure the keys aren't excluded
+    kept = {k: v for k, v in projection.items() if k not in ("timestamp", "_id")}
+    return kept or None
+
+
+def audit_page_query(
+    user_id=None, action=None, since=None, until=None, cursor=None, projection=None
+):
+
+    # (filter, projection) for one page; fetch limit + 1 rows sorted by
+    # AUDIT_SORT and hand them to audit_page()
+    query = _audit_filter(user_id, action, since, until)
+    if cursor:
+        query = _after(query, cursor)
+    return query, _with_sort_fields(projection)
+
+
+def audit_page(logs, limit):
+
+    # One extra row tells us whether there is a next page
+    next_cursor = encode_cursor(logs[limit - 1]) if len(logs) > limit else None
+    return {
+        "logs": [_from_storage(log) for log in logs[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+
+def get_audit_logs(
+    user_id=None,
+    action=None,
+    since=None,
+    until=None,
+    limit=50,
+    cursor=None,
+    projection=None,
+):
+
+    query, projection = audit_page_query(
+        user_id, action, since, until, cursor, projection
+    )
+    logs = list(
+        iter_documents(
+            "audit_log",
+            query,
+            projection=projection,
+            sort_by=AUDIT_SORT,
+            limit=limit + 1,
+        )
+    )
+    return audit_page(logs, limit)
+
+
+def iter_audit_logs(
+    user_id=None,
+    action=None,
+    since=None,
+    until=None,
+    projection=None,
+    batch_size=1000,
+):
+
+    # Streams every matching event, newest first, for exports
+    if projection:
+        projection = {audit_field(key): value for key, value in projection.items()}
+    for log in iter_documents(
+        "audit_log",
+        _audit_filter(user_id, action, since, until),
+        projection=projection,
+        sort_by=AUDIT_SORT,
+        batch_size=batch_size,
+    ):
+        yield _from_storage(log)
+
+
+def audit_query_from_args(args):
+
+    # Query string -> get_audit_logs() kwargs (shared by both backends)
+    since = args.get("since")
+    until = args.get("until")
+    return {
+        "user_id": args.get("user_id"),
+        "action": args.get("action"),
+        "since": datetime.fromisoformat(since) if since else None,
+        "until": datetime.fromisoformat(until) if until else None,
+        "limit": min(max(int(args.get("limit", 50)), 1), 200),
+        "cursor": args.get("cursor"),
+        "projection": {"details": 0},
+    }
+
+
+def serialize_audit_log(log):
 
-    logs = find_documents["audit_log"].find(query).sort("timestamp", -1)
-    return sorted(logs, key=lambda x: x["timestamp"], reverse=True)
+    return {**log, "_id": str(log["_id"]), "timestamp": log["timestamp"].isoformat()}
@@ -0,0 +1,120 @@
+# Hourly per-action counts of audit events, for dashboards
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+from connection.connect_db import get_collection, MONGO_COLLECTIONS, audit_field
+from db.db_operations import iter_documents
+from utils.helpers import green, red, reset
+
+load_dotenv()
+
+# Recount this many hours back on every run, so late events are included
+AUDIT_ROLLUP_LOOKBACK_HOURS = int(os.getenv("AUDIT_ROLLUP_LOOKBACK_HOURS", "2"))
+AUDIT_ROLLUP_INTERVAL = float(os.getenv("AUDIT_ROLLUP_INTERVAL", "300"))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_audit_counts(since: datetime = None, until: datetime = None):
+
+    # Counts events per (hour, action) in [since, until) and upserts them into
+    # audit_rollup. Whole hours are recounted, so re-running is idempotent.
+    until = until or datetime.now()
+    since = _hour(since or until - timedelta(hours=AUDIT_ROLLUP_LOOKBACK_HOURS))
+    action = "$" + audit_field("action")
+
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since, "$lt": until}}},
+        {
+            "$group": {
+                "_id": {
+                    "hour": {"$dateTrunc": {"date": "$timestamp", "unit": "hour"}},
+                    "action": action,
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "hour": "$_id.hour",
+                "action": "$_id.action",
+                "count": 1,
+                "updated_at": "$$NOW",
+            }
+        },
+        {
+            "$merge": {
+                "into": MONGO_COLLECTIONS["audit_rollup"],
+                "on": "_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+    try:
+        get_collection("audit_log").aggregate(pipeline)
+        logger.info(
+            green + f"Audit rollup updated for {since:%Y-%m-%d %H:00} onwards" + reset
+        )
+        return True
+    except PyMongoError as e:
+        logger.error(red + f"Audit rollup failed: {e}" + reset)
+        return False
+
+
+def get_audit_counts(since: datetime = None, until: datetime = None, action=None):
+
+    # Reads the small rollup collection instead of scanning raw events
+    query = {}
+    if action:
+        query["action"] = action
+    if since or until:
+        query["hour"] = {}
+        if since:
+            query["hour"]["$gte"] = _hour(since)
+        if until:
+            query["hour"]["$lt"] = until
+    return list(
+        iter_documents(
+            "audit_rollup",
+            query,
+            projection={"_id": 0, "updated_at": 0},
+            sort_by=[("hour", -1), ("action", 1)],
+        )
+    )
+
+
+def start_rollup_job(interval: float = AUDIT_ROLLUP_INTERVAL):
+
+    # Runs rollup_audit_counts() every interval seconds in a daemon thread
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            rollup_audit_counts()
+            stop.wait(interval)
+
+    threading.Thread(target=run, name="audit-rollup", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--once" in sys.argv:
+        rollup_audit_counts()
+    else:
+        while True:
+            rollup_audit_counts()
+            time.sleep(AUDIT_ROLLUP_INTERVAL)
@@ -0,0 +1,90 @@
+# One-off migration: store the fingerprint digest on admin_log entries
+# written before login switched to the indexed lookup.
+#
+#   python -m db.backfill_fingerprints          entries without a digest
+#   python -m db.backfill_fingerprints --all    recompute every digest
+#   python -m db.backfill_fingerprints --enroll admin@example.com
+#
+# Entries enrolled with the old collector hold truncated MAC addresses, so
+# their digests never match a fingerprint collected today. --enroll
+# records the machine it runs on for the given admin; run it once on each
+# admin's machine before they log in again.
+import sys
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from connection.connect_db import ensure_indexes
+from db.db_operations import (
+    iter_documents,
+    bulk_write,
+    find_documents,
+    insert_document,
+)
+from utils.fingerprint import fingerprint_digest, get_fingerprint, degraded_probes
+from utils.helpers import green, red, reset
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def backfill_fingerprints(recompute: bool = False, batch_size: int = 500):
+
+    query = {} if recompute else {"fingerprint": {"$exists": False}}
+    operations = (
+        UpdateOne(
+            {"_id": log["_id"]}, {"$set": {"fingerprint": fingerprint_digest(log)}}
+        )
+        for log in iter_documents(
+            "admin_log", query, sort_by=[("_id", 1)], batch_size=batch_size
+        )
+    )
+    report = bulk_write("admin_log", operations, batch_size=batch_size)
+    logger.info(
+        green + f"Backfilled {report['modified']} admin_log fingerprint(s)" + reset
+    )
+    return report
+
+
+def enroll_machine(email: str, force: bool = False):
+
+    # Adds this machine's current fingerprint to admin_log for `email`
+    if not find_documents("admin", {"email": email}):
+        logger.error(red + f"No admin with email {email}" + reset)
+        return None
+    system_info = get_fingerprint(refresh=True)
+    if degraded_probes() and not force:
+        # A fallback value would enroll a digest no real login reproduces
+        logger.error(
+            red
+            + f"Probes failed: {', '.join(degraded_probes())}; "
+            + "retry, or pass --force to enroll anyway"
+            + reset
+        )
+        return None
+    digest = fingerprint_digest(system_info)
+    if find_documents("admin_log", {"fingerprint": digest}, limit=1):
+        logger.info(green + "This machine is already enrolled" + reset)
+        return digest
+    insert_document(
+        "admin_log",
+        {
+            **system_info,
+            "fingerprint": digest,
+            "email": email,
+            "enrolled_at": datetime.now(),
+        },
+    )
+    logger.info(green + f"Enrolled this machine for {email}" + reset)
+    return digest
+
+
+if __name__ == "__main__":
+    ensure_indexes()
+    if "--enroll" in sys.argv:
+        email = sys.argv[sys.argv.index("--enroll") + 1]
+        digest = enroll_machine(email, force="--force" in sys.argv)
+        sys.exit(0 if digest else 1)
+    report = backfill_fingerprints(recompute="--all" in sys.argv)
+    sys.exit(1 if report["errors"] else 0)
@@ -0,0 +1,156 @@
+# Serialization for the Redis cache (handles ObjectId / datetime from Mongo)
+import os
+import struct
+import logging
+from datetime import datetime
+import bson
+from bson import ObjectId, json_util
+from dotenv import load_dotenv
+from utils.helpers import blue, reset
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+load_dotenv()
+
+CACHE_CODEC = os.getenv("CACHE_CODEC", "bson")
+# Unset: zstd when zstandard is installed, otherwise none
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION")
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "1024"))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Every cached value starts with a 2 byte header: codec id, compression id.
+# That way values written with other settings can still be read back.
+_HEADER = struct.Struct("BB")
+
+_EXT_OBJECTID = 1
+_EXT_DATETIME = 2
+
+
+def _bson_dumps(value):
+    return bson.encode({"v": value})
+
+
+def _bson_loads(data):
+    return bson.decode(data)["v"]
+
+
+def _json_dumps(value):
+    return json_util.dumps(value).encode()
+
+
+def _json_loads(data):
+    return json_util.loads(data)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, ObjectId):
+        return msgpack.ExtType(_EXT_OBJECTID, obj.binary)
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _msgpack_ext_hook(code, data):
+    if code == _EXT_OBJECTID:
+        return ObjectId(data)
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False)
+
+
+# name: (id, dumps, loads)
+CODECS = {
+    "json": (0, _json_dumps, _json_loads),
+    "bson": (1, _bson_dumps, _bson_loads),
+}
+if msgpack is not None:
+    CODECS["msgpack"] = (2, _msgpack_dumps, _msgpack_loads)
+
+# name: (id, compress, decompress)
+COMPRESSORS = {"none": (0, None, None)}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = (
+        1,
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+if lz4_frame is not None:
+    COMPRESSORS["lz4"] = (2, lz4_frame.compress, lz4_frame.decompress)
+
+_CODECS_BY_ID = {codec_id: loads for codec_id, _, loads in CODECS.values()}
+_DECOMPRESSORS_BY_ID = {
+    comp_id: decompress for comp_id, _, decompress in COMPRESSORS.values()
+}
+
+
+def _pick(options, name, fallback, kind):
+    if name in options:
+        return name
+    logger.warning(
+        blue + f"Cache {kind} '{name}' is not available, using '{fallback}'" + reset
+    )
+    return fallback
+
+
+codec_name = _pick(CODECS, CACHE_CODEC, "bson", "codec")
+if CACHE_COMPRESSION:
+    compression_name = _pick(COMPRESSORS, CACHE_COMPRESSION, "none", "compression")
+else:
+    # zstandard is optional; only an explicit choice warns when it is missing
+    compression_name = "zstd" if "zstd" in COMPRESSORS else "none"
+
+
+def encode(value) -> bytes:
+
+    codec_id, dumps, _ = CODECS[codec_name]
+    payload = dumps(value)
+
+    comp_id, compress, _ = COMPRESSORS[compression_name]
+    if compress is None or len(payload) < CACHE_COMPRESS_THRESHOLD:
+        comp_id = 0
+    else:
+        payload = compress(payload)
+
+    return _HEADER.pack(codec_id, comp_id) + payload
+
+
+def decode(data: bytes):
+
+    codec_id, comp_id = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size :]
+
+    if comp_id:
+        decompress = _DECOMPRESSORS_BY_ID.get(comp_id)
+        if decompress is None:
+            raise ValueError(f"Unsupported cache compression id: {comp_id}")
+        payload = decompress(payload)
+
+    loads = _CODECS_BY_ID.get(codec_id)
+    if loads is None:
+        raise ValueError(f"Unsupported cache codec id: {codec_id}")
+    return loads(payload)
@@ -1,7 +1,17 @@
 # Mongo operations
+import os
+import hashlib
 import logging
-from pymongo.errors import PyMongoError
-from db.redis_operations import get_cache, set_cache, delete_cache
+from itertools import islice
+from bson import json_util
+from pymongo import InsertOne
+from pymongo.errors import PyMongoError, BulkWriteError
+from db.redis_operations import (
+    get_or_load,
+    delete_cache,
+    cache_tag,
+    invalidate_tags,
+)
 from connection.connect_db import get_collection, MONGO_COLLECTIONS
 from utils.helpers import green, blue, red, reset
 
@@ -11,14 +21,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+# Set to false when nothing uses find_documents(cache=True / cache_key=...):
+# queries are never cached and writes skip the invalidation round trip
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+
+
+def make_cache_key(
+    collection_key: str, query: dict = None, sort_by=None, limit: int = 0
+):
+
+    # Same query shape -> same key, regardless of dict key order
+    shape = json_util.dumps(
+        {"query": query or {}, "sort": sort_by, "limit": limit}, sort_keys=True
+    )
+    digest = hashlib.sha256(shape.encode()).hexdigest()[:32]
+    return f"query:{collection_key}:{digest}"
+
 
-def insert_document(collection_key: str, document: dict, cache_key: str = None):
+def invalidate_cache(collection_key: str, cache_key: str = None):
+
+    # Writes drop every cached query of the collection: a changed document
+    # can be in the result of any of them, whatever fields they filtered on
+    if not QUERY_CACHE_ENABLED:
+        return
+    if cache_key:
+        delete_cache(cache_key)
+    invalidate_tags([cache_tag(collection_key)])
+
+
+def insert_document(
+    collection_key: str,
+    document: dict,
+    cache_key: str = None,
+):
 
     try:
         collection_name = MONGO_COLLECTIONS.get(collection_key)
         if not collection_name:
             raise ValueError(f"Invalid collection key: {collection_key}")
-        collection = get_collection(collection_name)
+        collection = get_collection(collection_key)
 
         if collection is None:
             raise ValueError(f"Collection '{collection_name}' not found.")
@@ -26,8 +68,8 @@ def insert_document(collection_key: str, document: dict, cache_key: str = None):
         result = collection.insert_one(document)
         if result.inserted_id:
             logger.info(green + f"Document added to {collection_name}" + reset)
-            if cache_key:
-                delete_cache(cache_key)  # Clear cache for related queries
+            # Clear cache for related queries
+            invalidate_cache(collection_key, cache_key)
         else:
             logger.warning(
                 blue + f"Document insertion failed in {collection_name}" + reset
@@ -38,6 +80,117 @@ def insert_document(collection_key: str, document: dict, cache_key: str = None):
         )
 
 
+def _batches(items, batch_size):
+
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_write(
+    collection_key: str,
+    operations,
+    batch_size: int = BULK_BATCH_SIZE,
+    cache_key: str = None,
+):
+
+    report = {
+        "batches": 0,
+        "inserted": 0,
+        "modified": 0,
+        "deleted": 0,
+        "upserted": 0,
+        "errors": [],
+    }
+    try:
+        collection_name = MONGO_COLLECTIONS.get(collection_key)
+        if not collection_name:
+            raise ValueError(f"Invalid collection key: {collection_key}")
+        collection = get_collection(collection_key)
+
+        if collection is None:
+            raise ValueError(f"Collection '{collection_name}' not found.")
+
+        for batch_number, batch in enumerate(_batches(operations, batch_size)):
+            report["batches"] += 1
+            try:
+                result = collection.bulk_write(batch, ordered=False)
+                counts = result.bulk_api_result
+            except BulkWriteError as e:
+                # Unordered: everything but the failed ops was still applied.
+                counts = e.details
+                report["errors"].append(
+                    {
+                        "batch": batch_number,
+                        "size": len(batch),
+                        "failed": len(counts.get("writeErrors", [])),
+                        "errors": [
+                            {"index": err.get("index"), "message": err.get("errmsg")}
+                            for err in counts.get("writeErrors", [])
+                        ],
+                    }
+                )
+                logger.warning(
+                    blue
+                    + f"Batch {batch_number} into {collection_name}: "
+                    + f"{len(counts.get('writeErrors', []))} write error(s)"
+                    + reset
+                )
+            except PyMongoError as e:
+                counts = {}
+                report["errors"].append(
+                    {
+                        "batch": batch_number,
+                        "size": len(batch),
+                        "failed": len(batch),
+                        "errors": [{"index": None, "message": str(e)}],
+                    }
+                )
+                logger.error(
+                    red
+                    + f"Batch {batch_number} into {collection_name} failed: {e}"
+                    + reset
+                )
+
+            report["inserted"] += counts.get("nInserted", 0)
+            report["modified"] += counts.get("nModified", 0)
+            report["deleted"] += counts.get("nRemoved", 0)
+            report["upserted"] += counts.get("nUpserted", 0)
+
+            # Clear cache once per batch instead of once per document
+            invalidate_cache(collection_key, cache_key)
+
+        logger.info(
+            green
+            + f"Bulk write to {collection_name}: {report['inserted']} inserted, "
+            + f"{report['modified']} modified, {report['deleted']} deleted "
+            + f"in {report['batches']} batch(es)"
+            + reset
+        )
+    except Exception as e:
+        logger.error(red + f"Error in bulk write to {collection_key}: {e}" + reset)
+        report["errors"].append({"batch": None, "errors": [{"message": str(e)}]})
+    return report
+
+
+def insert_documents(
+    collection_key: str,
+    documents,
+    batch_size: int = BULK_BATCH_SIZE,
+    cache_key: str = None,
+):
+
+    return bulk_write(
+        collection_key,
+        (InsertOne(document) for document in documents),
+        batch_size=batch_size,
+        cache_key=cache_key,
+    )
+
+
 def find_documents(
     collection_key: str,
     query: dict = None,
@@ -45,41 +198,40 @@ def find_documents(
     sort_by: tuple = None,
     cache_key: str = None,
     expiry: int = 3600,
+    cache: bool = False,
 ):
 
     try:
-        # Check Redis cache first
-        if cache_key:
-            cached_result = get_cache(cache_key)
-            if cached_result:
-                logger.info(green + f"Cache hit for key: {cache_key}" + reset)
-                return cached_result
-
-        # Query MongoDB if no cache
         collection_name = MONGO_COLLECTIONS.get(collection_key)
         if not collection_name:
             raise ValueError(f"Invalid collection key: {collection_key}")
-        collection = get_collection(collection_name)
-        query = query or {}
-        cursor = collection.find(query)
 
-        if sort_by:
-            cursor = cursor.sort(sort_by)
-        if limit:
-            cursor = cursor.limit(limit)
+        def load():
+            collection = get_collection(collection_key)
+            cursor = collection.find(query or {})
 
-        documents = list(cursor)
-        logger.info(
-            green
-            + f"Retrieved {len(documents)} documents from {collection_name}"
-            + reset
-        )
+            if sort_by:
+                cursor = cursor.sort(sort_by)
+            if limit:
+                cursor = cursor.limit(limit)
 
-        # Store result in cache
-        if cache_key:
-            set_cache(cache_key, documents, expiry)
+            documents = list(cursor)
+            logger.info(
+                green
+                + f"Retrieved {len(documents)} documents from {collection_name}"
+                + reset
+            )
+            return documents
 
-        return documents
+        # Cached queries go through get_or_load so concurrent misses
+        # only query MongoDB once
+        if QUERY_CACHE_ENABLED and (cache or cache_key):
+            cache_key = cache_key or make_cache_key(
+                collection_key, query, sort_by, limit
+            )
+            tags = [cache_tag(collection_key)]
+            return get_or_load(cache_key, load, expiry, tags=tags)
+        return load()
     except PyMongoError as e:
         logger.error(
             red + f"Failed to retrieve documents from {collection_key}: {e}" + reset
@@ -94,6 +246,57 @@ def find_documents(
         return []
 
 
+def iter_documents(
+    collection_key: str,
+    query: dict = None,
+    projection: dict = None,
+    sort_by: tuple = None,
+    limit: int = 0,
+    batch_size: int = 0,
+    hint=None,
+    max_time_ms: int = None,
+):
+
+    # Streams documents from a server cursor instead of building a list.
+    count = 0
+    try:
+        collection_name = MONGO_COLLECTIONS.get(collection_key)
+        if not collection_name:
+            raise ValueError(f"Invalid collection key: {collection_key}")
+        collection = get_collection(collection_key)
+        cursor = collection.find(query or {}, projection)
+
+        if sort_by:
+            cursor = cursor.sort(sort_by)
+        if limit:
+            cursor = cursor.limit(limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if hint:
+            cursor = cursor.hint(hint)
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+
+        with cursor:
+            for document in cursor:
+                count += 1
+                yield document
+
+        logger.info(
+            green + f"Streamed {count} documents from {collection_name}" + reset
+        )
+    except PyMongoError as e:
+        logger.error(
+            red
+            + f"Failed to stream documents from {collection_key} after {count}: {e}"
+            + reset
+        )
+    except ValueError as e:
+        logger.error(
+            red + f"Failed to stream documents from {collection_key}: {e}" + reset
+        )
+
+
 def update_documents(
     collection_key: str,
     query: dict,
@@ -106,7 +309,7 @@ def update_documents(
         collection_name = MONGO_COLLECTIONS.get(collection_key)
         if not collection_name:
             raise ValueError(f"Invalid collection key: {collection_key}")
-        collection = get_collection(collection_name)
+        collection = get_collection(collection_key)
         if "$set" not in update_data:
             update_data = {"$set": update_data}
 
@@ -122,8 +325,7 @@ def update_documents(
         )
 
         # Clear cache if applicable
-        if cache_key:
-            delete_cache(cache_key)
+        invalidate_cache(collection_key, cache_key)
 
         return result.modified_count
     except PyMongoError as e:
@@ -141,14 +343,17 @@ def update_documents(
 
 
 def delete_documents(
-    collection_key: str, query: dict, multiple: bool = False, cache_key: str = None
+    collection_key: str,
+    query: dict,
+    multiple: bool = False,
+    cache_key: str = None,
 ):
 
     try:
         collection_name = MONGO_COLLECTIONS.get(collection_key)
         if not collection_name:
             raise ValueError(f"Invalid collection key: {collection_key}")
-        collection = get_collection(collection_name)
+        collection = get_collection(collection_key)
         result = (
             collection.delete_many(query) if multiple else collection.delete_one(query)
         )
@@ -159,8 +364,7 @@ def delete_documents(
         )
 
         # Clear cache if applicable
-        if cache_key:
-            delete_cache(cache_key)
+        invalidate_cache(collection_key, cache_key)
 
         return result.deleted_count
     except PyMongoError as e:
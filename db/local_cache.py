@@ -0,0 +1,175 @@
+# In-process (L1) cache in front of Redis
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.helpers import green, red, reset
+
+load_dotenv()
+
+L1_CACHE_ENABLED = os.getenv("L1_CACHE_ENABLED", "false").lower() == "true"
+L1_CACHE_MAXSIZE = int(os.getenv("L1_CACHE_MAXSIZE", "1024"))
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "30"))
+INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    # Bounded LRU with a per-entry TTL. Values are stored as encoded bytes so
+    # callers never share (and mutate) the same object.
+
+    def __init__(self, maxsize=L1_CACHE_MAXSIZE, ttl=L1_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+local_cache = LocalCache()
+# Caches that invalidation messages evict from (see watch_invalidations)
+_caches = [local_cache]
+
+# Lets the listener skip our own invalidation messages
+_origin = uuid.uuid4().hex
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _on_invalidate(message):
+
+    # "<origin>|<key>[\n<key>...]"
+    origin, _, keys = message["data"].partition("|")
+    if origin != _origin:
+        for key in keys.split("\n"):
+            _evict(key)
+
+
+def _evict(key):
+    for cache in _caches:
+        cache.delete(key)
+
+
+def watch_invalidations(cache):
+
+    # Have published invalidations evict from another LocalCache as well;
+    # its keys share the namespace of the Redis keys they shadow
+    if cache not in _caches:
+        _caches.append(cache)
+
+
+def start_invalidation_listener(redis_client):
+
+    # Returns whether this process is listening
+    global _listener
+    if _listener is not None:
+        return True
+    with _listener_lock:
+        if _listener is not None:
+            return True
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidate})
+            _listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            logger.info(
+                green
+                + f"Listening for cache invalidation on {INVALIDATION_CHANNEL}"
+                + reset
+            )
+        except Exception as e:
+            logger.error(
+                red + f"Failed to start cache invalidation listener: {e}" + reset
+            )
+    return _listener is not None
+
+
+def is_listening():
+    return _listener is not None
+
+
+def publish_invalidation(redis_client, key):
+    publish_invalidations(redis_client, [key])
+
+
+def publish_invalidations(redis_client, keys, pipe=None):
+
+    # One message for all `keys`. With `pipe` the PUBLISH is queued on that
+    # pipeline and goes out (and fails) with the rest of it
+    keys = list(keys)
+    if not keys:
+        return
+    for key in keys:
+        _evict(key)
+    message = f"{_origin}|" + "\n".join(keys)
+    if pipe is not None:
+        pipe.publish(INVALIDATION_CHANNEL, message)
+        return
+    try:
+        redis_client.publish(INVALIDATION_CHANNEL, message)
+    except Exception as e:
+        logger.error(
+            red + f"Failed to publish invalidation for {len(keys)} key(s): {e}" + reset
+        )
+
+
+def _after_fork():
+    # The listener thread does not survive a fork
+    global _listener, _origin
+    _listener = None
+    _origin = uuid.uuid4().hex
+    for cache in _caches:
+        cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,7 +1,22 @@
-from connection.connect_redis import get_redis_client
+from connection.connect_redis import get_redis_client, redis_binary_client
+from db.cache_codec import encode, decode
+from db.local_cache import (
+    L1_CACHE_ENABLED,
+    local_cache,
+    start_invalidation_listener,
+    publish_invalidation,
+    publish_invalidations,
+)
 from utils.helpers import green, blue, red, reset
+import os
+import re
+import math
+import time
+import uuid
+import random
 import logging
-import json
+import threading
+from concurrent.futures import Future
 
 redis_client = get_redis_client()
 
@@ -10,11 +25,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Hit / miss counters for the Redis tier (L1 keeps its own)
+_stats_lock = threading.Lock()
+redis_stats = {"hits": 0, "misses": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        redis_stats[name] += 1
+
+
+def get_cache_stats():
+
+    with _stats_lock:
+        stats = {"redis": dict(redis_stats)}
+    stats["l1"] = local_cache.stats() if L1_CACHE_ENABLED else None
+    return stats
+
+
+def _l1_ttl(pttl):
+
+    # Redis PTTL -> seconds for LocalCache.set: -1 (no expiry) is None,
+    # -2 (gone since it was read) is 0 so L1 does not keep it either
+    if pttl == -2:
+        return 0
+    return pttl / 1000 if pttl and pttl > 0 else None
+
 
 def set_cache(key, value, expiry=3600):
 
     try:
-        redis_client.setex(key, expiry, json.dumps(value))
+        payload = encode(value)
+        redis_binary_client.setex(key, expiry, payload)
+        if L1_CACHE_ENABLED:
+            # Other processes may still hold the old value
+            publish_invalidation(redis_client, key)
+            local_cache.set(key, payload, expiry)
         logger.info(green + f"Cache set for key: {key}" + reset)
     except Exception as e:
         logger.error(red + f"Failed to set cache for key: {key}. Error: {e}" + reset)
@@ -23,10 +69,28 @@ def set_cache(key, value, expiry=3600):
 def get_cache(key):
 
     try:
-        value = redis_client.get(key)
+        if L1_CACHE_ENABLED:
+            start_invalidation_listener(redis_client)
+            payload = local_cache.get(key)
+            if payload is not None:
+                logger.info(blue + f"L1 cache hit for key: {key}" + reset)
+                return decode(payload)
+
+            # Fetch value and remaining TTL in one round trip
+            pipe = redis_binary_client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            value, ttl = pipe.execute()
+            if value:
+                local_cache.set(key, value, _l1_ttl(ttl))
+        else:
+            value = redis_binary_client.get(key)
+
         if value:
+            _count("hits")
             logger.info(blue + f"Cache hit for key: {key}" + reset)
-            return json.loads(value)
+            return decode(value)
+        _count("misses")
         logger.info(blue + f"Cache miss for key: {key}" + reset)
         return None
     except Exception as e:
@@ -38,6 +102,361 @@ def delete_cache(key):
 
     try:
         redis_client.delete(key)
+        if L1_CACHE_ENABLED:
+            publish_invalidation(redis_client, key)
         logger.info(green + f"Cache cleared for key: {key}" + reset)
     except Exception as e:
         logger.error(red + f"Failed to clear cache for key: {key}. Error: {e}" + reset)
+
+
+#
+# ---- Multi-key operations (one round trip per chunk) --->
+#
+
+REDIS_CHUNK_SIZE = int(os.getenv("REDIS_CHUNK_SIZE", "500"))
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def get_many(keys, chunk_size=REDIS_CHUNK_SIZE):
+
+    # Returns {key: value} for the keys that are cached. L1 hits are
+    # counted by local_cache, so redis_stats only sees the keys sent to Redis
+    found = {}
+    try:
+        keys = list(keys)
+        remote = keys
+        if L1_CACHE_ENABLED:
+            start_invalidation_listener(redis_client)
+            for key in keys:
+                payload = local_cache.get(key)
+                if payload is not None:
+                    found[key] = decode(payload)
+            remote = [key for key in keys if key not in found]
+
+        redis_hits = 0
+        for chunk in _chunks(remote, chunk_size):
+            if L1_CACHE_ENABLED:
+                # Remaining TTLs in the same round trip, so L1 never keeps a
+                # value longer than Redis does
+                pipe = redis_binary_client.pipeline(transaction=False)
+                pipe.mget(chunk)
+                for key in chunk:
+                    pipe.pttl(key)
+                values, *ttls = pipe.execute()
+            else:
+                values, ttls = redis_binary_client.mget(chunk), [None] * len(chunk)
+            for key, value, ttl in zip(chunk, values, ttls):
+                if value:
+                    found[key] = decode(value)
+                    redis_hits += 1
+                    if L1_CACHE_ENABLED:
+                        local_cache.set(key, value, _l1_ttl(ttl))
+
+        with _stats_lock:
+            redis_stats["hits"] += redis_hits
+            redis_stats["misses"] += len(remote) - redis_hits
+        logger.info(
+            blue + f"Cache get_many: {len(found)} hit(s) of {len(keys)} key(s)" + reset
+        )
+    except Exception as e:
+        logger.error(red + f"Failed to get many cache keys. Error: {e}" + reset)
+    return found
+
+
+def set_many(mapping, expiry=3600, chunk_size=REDIS_CHUNK_SIZE):
+
+    try:
+        for chunk in _chunks(mapping.items(), chunk_size):
+            pipe = redis_binary_client.pipeline(transaction=False)
+            for key, value in chunk:
+                pipe.setex(key, expiry, encode(value))
+            if L1_CACHE_ENABLED:
+                publish_invalidations(redis_client, [key for key, _ in chunk], pipe)
+            pipe.execute()
+        logger.info(green + f"Cache set for {len(mapping)} key(s)" + reset)
+    except Exception as e:
+        logger.error(red + f"Failed to set many cache keys. Error: {e}" + reset)
+
+
+def delete_many(keys, chunk_size=REDIS_CHUNK_SIZE):
+
+    deleted = 0
+    try:
+        for chunk in _chunks(keys, chunk_size):
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(*chunk)
+            if L1_CACHE_ENABLED:
+                publish_invalidations(redis_client, chunk, pipe)
+            deleted += pipe.execute()[0]
+        logger.info(green + f"Cache cleared for {deleted} key(s)" + reset)
+    except Exception as e:
+        logger.error(red + f"Failed to clear many cache keys. Error: {e}" + reset)
+    return deleted
+
+
+def delete_by_prefix(prefix, chunk_size=REDIS_CHUNK_SIZE):
+
+    # SCAN instead of KEYS so Redis is never blocked on a large keyspace
+    pattern = re.sub(r"([*?\[\]\\])", r"\\\1", prefix) + "*"
+    deleted = 0
+    try:
+        batch = []
+        for key in redis_client.scan_iter(match=pattern, count=chunk_size):
+            batch.append(key)
+            if len(batch) >= chunk_size:
+                deleted += delete_many(batch, chunk_size)
+                batch = []
+        if batch:
+            deleted += delete_many(batch, chunk_size)
+        logger.info(
+            green + f"Cache cleared for {deleted} key(s) with prefix: {prefix}" + reset
+        )
+    except Exception as e:
+        logger.error(
+            red + f"Failed to clear cache for prefix: {prefix}. Error: {e}" + reset
+        )
+    return deleted
+
+
+#
+# ---- Stampede protection for cached loads --->
+#
+
+CACHE_STALE_GRACE = int(os.getenv("CACHE_STALE_GRACE", "60"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "10000"))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "5"))
+CACHE_REFRESH_BETA = float(os.getenv("CACHE_REFRESH_BETA", "1.0"))
+
+# Only delete the lock if we still own it
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _should_refresh(envelope, beta):
+    # Probabilistic early expiry (XFetch): the longer the load takes and the
+    # closer the expiry, the more likely a caller refreshes ahead of time.
+    delta = envelope.get("delta", 0.0)
+    jitter = -delta * beta * math.log(1.0 - random.random())
+    return time.time() + jitter >= envelope["expires_at"]
+
+
+def _load_and_store(key, loader, expiry, tags=None):
+
+    # Tagged values are stored only if no write invalidated one of the tags
+    # while the loader ran (the generations are read before it starts)
+    generations = tag_generations(tags) if tags else None
+    started = time.perf_counter()
+    value = loader()
+    delta = time.perf_counter() - started
+    envelope = {
+        "value": value,
+        "delta": delta,
+        "expires_at": time.time() + expiry,
+    }
+    # Keep the value a little past its expiry so waiters can be served stale
+    if not tags:
+        set_cache(key, envelope, expiry + CACHE_STALE_GRACE)
+    elif generations is not None:
+        set_tagged_cache(key, envelope, tags, generations, expiry + CACHE_STALE_GRACE)
+    return value
+
+
+def _load_with_redis_lock(key, loader, expiry, stale, tags=None):
+
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    try:
+        acquired = redis_client.set(lock_key, token, nx=True, px=CACHE_LOCK_TTL_MS)
+    except Exception as e:
+        # Redis is down: nothing to coordinate with or store into, so go
+        # straight to the source like an uncached read would
+        logger.error(
+            red + f"Failed to take lock for key: {key}, loading directly: {e}" + reset
+        )
+        return loader()
+    if acquired:
+        try:
+            return _load_and_store(key, loader, expiry, tags)
+        finally:
+            try:
+                redis_client.eval(_RELEASE_LOCK, 1, lock_key, token)
+            except Exception as e:
+                logger.error(
+                    red + f"Failed to release lock for key: {key}. Error: {e}" + reset
+                )
+
+    # Another process is loading it
+    if stale is not None:
+        logger.info(blue + f"Serving stale value for key: {key}" + reset)
+        return stale["value"]
+
+    deadline = time.monotonic() + CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        envelope = get_cache(key)
+        if isinstance(envelope, dict) and "expires_at" in envelope:
+            return envelope["value"]
+    logger.warning(
+        blue + f"Timed out waiting for loader of key: {key}, loading directly" + reset
+    )
+    return _load_and_store(key, loader, expiry, tags)
+
+
+def get_or_load(key, loader, expiry=3600, beta=CACHE_REFRESH_BETA, tags=None):
+
+    envelope = get_cache(key)
+    if not (isinstance(envelope, dict) and "expires_at" in envelope):
+        envelope = None
+    if envelope is not None and not _should_refresh(envelope, beta):
+        return envelope["value"]
+
+    # Single-flight inside this process: one leader per key, others share it
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        if envelope is not None:
+            return envelope["value"]
+        return future.result()
+
+    try:
+        value = _load_with_redis_lock(key, loader, expiry, envelope, tags)
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+#
+# ---- Tag based invalidation --->
+#
+
+# Store a value and add it to its tags in one step, unless a tag's
+# generation moved since the caller read it (a write raced the load).
+# KEYS: key, tags..., generations...; ARGV: payload, expiry, generations...
+_STORE_TAGGED = """
+local n = (#KEYS - 1) / 2
+for i = 1, n do
+    if (redis.call('get', KEYS[1 + n + i]) or '0') ~= ARGV[2 + i] then
+        return 0
+    end
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+-- Only ever extend a tag's TTL so no member outlives the set tracking it
+for i = 1, n do
+    local tag = KEYS[1 + i]
+    redis.call('sadd', tag, KEYS[1])
+    if redis.call('ttl', tag) < tonumber(ARGV[2]) then
+        redis.call('expire', tag, ARGV[2])
+    end
+end
+return 1
+"""
+
+# Bump the tags' generations, then delete every key in the given tags and
+# the tags themselves in one step. KEYS: tags..., generations...
+_INVALIDATE_TAGS = """
+local n = #KEYS / 2
+local deleted = {}
+for i = 1, n do
+    local tag = KEYS[i]
+    redis.call('incr', KEYS[n + i])
+    local members = redis.call('smembers', tag)
+    for j = 1, #members, 500 do
+        local chunk = {unpack(members, j, math.min(j + 499, #members))}
+        redis.call('del', unpack(chunk))
+        for _, key in ipairs(chunk) do
+            table.insert(deleted, key)
+        end
+    end
+    redis.call('del', tag)
+end
+return deleted
+"""
+
+
+def cache_tag(collection_key):
+    return f"cache_tag:{collection_key}"
+
+
+def _generation_key(tag):
+    # One counter per tag, bumped by every invalidation. Never expires: there
+    # are only as many as there are tags
+    return f"cache_gen:{tag}"
+
+
+def tag_generations(tags):
+
+    # Current generation of each tag, or None when Redis can't be read (the
+    # caller then skips storing)
+    try:
+        values = redis_client.mget([_generation_key(tag) for tag in tags])
+        return [value or "0" for value in values]
+    except Exception as e:
+        logger.error(
+            red + f"Failed to read tag generations: {tags}. Error: {e}" + reset
+        )
+        return None
+
+
+def set_tagged_cache(key, value, tags, generations, expiry=3600):
+
+    # Stores the value and adds it to its tags in one round trip, guarded by
+    # the generations from tag_generations(); returns whether it was stored
+    try:
+        payload = encode(value)
+        keys = [key, *tags, *(_generation_key(tag) for tag in tags)]
+        stored = redis_binary_client.eval(
+            _STORE_TAGGED, len(keys), *keys, payload, expiry, *generations
+        )
+        if not stored:
+            logger.info(blue + f"Skipped caching stale value for key: {key}" + reset)
+            return False
+        if L1_CACHE_ENABLED:
+            publish_invalidation(redis_client, key)
+            local_cache.set(key, payload, expiry)
+        logger.info(green + f"Cache set for key: {key}" + reset)
+        return True
+    except Exception as e:
+        logger.error(red + f"Failed to set cache for key: {key}. Error: {e}" + reset)
+        return False
+
+
+def invalidate_tags(tags):
+
+    try:
+        keys = [*tags, *(_generation_key(tag) for tag in tags)]
+        deleted = redis_client.eval(_INVALIDATE_TAGS, len(keys), *keys)
+        if L1_CACHE_ENABLED:
+            for chunk in _chunks(deleted, REDIS_CHUNK_SIZE):
+                publish_invalidations(redis_client, chunk)
+        if deleted:
+            logger.info(
+                green
+                + f"Cache cleared for {len(deleted)} key(s) in tags: {tags}"
+                + reset
+            )
+        return len(deleted)
+    except Exception as e:
+        logger.error(red + f"Failed to invalidate tags: {tags}. Error: {e}" + reset)
+        return 0
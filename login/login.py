@@ -1,16 +1,18 @@
-import bcrypt, requests
 from utils.session import create_jwt
+from utils.two_factor import send_code, verify_code
+from utils.passwords import verify_and_rehash
 from utils.auth import input_masking
-from db.db_operations import find_documents
+from db.db_operations import find_documents, iter_documents, update_documents
 from db.audit import log_audit_event
-from connection.connect_redis import redis_client
+from utils.rate_limit import check_rate_limit, reset_rate_limit
 from scrapers.scraper_menu import scraper_menu
 from utils.sendmail import send_email
 from utils.auth import (
     get_system_info,
     sha256_encrypt,
     lock_account,
-    normalize_system_info,
+    fingerprint_digest,
+    degraded_probes,
 )
 from utils.helpers import (
     input_quit_handle,
@@ -52,24 +54,26 @@ def login():
         clear()
         return
 
-    attempts = redis_client.incr(f"rate_limit:login:{hashed_name}")
-    if attempts == 1:
-        redis_client.expire(f"rate_limit:login:{hashed_name}", 300)
-
-    if attempts > 5:  # Allow up to 5 attempts
+    # Allow up to 5 attempts per 5 minutes
+    if not check_rate_limit(f"login:{hashed_name}", limit=5, window=300).allowed:
         typing_effect(red + "Too many login attempts! Please try again later." + reset)
         sleep()
         clear()
         return
 
     # Verify password here (for rate limiter +=)
-    if not bcrypt.checkpw(password.encode(), admin["password"].encode()):
+    valid, new_hash = verify_and_rehash(password, admin["password"])
+    if not valid:
         typing_effect(red + "Incorrect password! Your account is locked." + reset)
         lock_account(admin)
         return
 
+    # Stored hash uses an outdated cost: upgrade it now we know the password
+    if new_hash:
+        update_documents("admin", {"_id": admin["_id"]}, {"password": new_hash})
+
     # Reset rate limit (If login succ6)
-    redis_client.delete(f"rate_limit:login:{hashed_name}")
+    reset_rate_limit(f"login:{hashed_name}")
 
     token = create_jwt(str(admin["_id"]), admin["email"])
 
@@ -84,16 +88,23 @@ def login():
         typing_effect(red + "Login process terminated due to 2FA failure." + reset)
         return
 
-    system_info = get_system_info()
-    system_log = find_documents("admin_log", {})
-    system_log = [
-        {key: value for key, value in log.items() if key != "_id"} for log in system_log
-    ]  # Remove the _id field if present
-
-    normalized_system_info = normalize_system_info(system_info)
-    normalized_system_log = normalize_system_info(system_log)
+    # One indexed lookup on the digest instead of comparing every entry
+    digest = fingerprint_digest(get_system_info())
+    system_known = any(
+        iter_documents(
+            "admin_log", {"fingerprint": digest}, projection={"_id": 1}, limit=1
+        )
+    )
 
-    if normalized_system_info not in normalized_system_log:
+    if not system_known and degraded_probes():
+        # Some probe fell back to its default; that is not proof of another
+        # machine, so deny this attempt without locking the account
+        probes = ", ".join(degraded_probes())
+        typing_effect(
+            red + f"Could not read system info ({probes}). Please try again." + reset
+        )
+        return
+    if not system_known:
         typing_effect(red + "System info mismatch! Your account is locked." + reset)
         lock_account(admin)
         return
@@ -109,46 +120,25 @@ def handle_2fa(admin, token):
 
     if admin.get("2fa_method") is True:
         typing_effect(blue + "Sending 2FA code to your email..." + reset)
-        try:
-            response = requests.post(
-                "http://127.0.0.1:5000/send-2fa", json={"email": admin["email"]}
-            )
-            response.raise_for_status()
-            expected_code = response.json().get("code")
-            if not expected_code:
-                typing_effect(red + "Failed to retrieve 2FA code from server." + reset)
-                return False
-        except requests.RequestException as e:
-            typing_effect(
-                red + f"Error sending 2FA code: {str(e)}. Login denied." + reset
-            )
+        result = send_code(admin["email"])
+        if result.error == "rate_limited":
+            typing_effect(red + "Too many 2FA codes requested. Login denied." + reset)
             return False
-
-        # Retrieve expected 2FA code
-        expected_code = response.json().get("code")
-        if not expected_code:
-            typing_effect(red + "Failed to retrieve 2FA code from server." + reset)
+        if not result.sent:
+            typing_effect(red + "Failed to send 2FA code. Login denied." + reset)
             return False
 
         # Prompt admin for 2FA code
         code = input_quit_handle("Enter the 2FA code sent to your email: ").strip()
-        try:
-            verification_response = requests.post(
-                "http://127.0.0.1:5000/verify-2fa",
-                json={"code": code, "expected_code": expected_code, "token": token},
-            )
-            verification_response.raise_for_status()
-            if verification_response.json().get("success"):
-                print(green + "2FA verification successful!" + reset)
-                return True
-            else:
-                typing_effect(red + "Invalid 2FA code. Login denied." + reset)
-                return False
-        except requests.RequestException as e:
-            typing_effect(
-                red + f"2FA verification failed: {str(e)}. Login denied." + reset
-            )
-            return False
+        result = verify_code(admin["email"], code)
+        if result.valid:
+            print(green + "2FA verification successful!" + reset)
+            return True
+        elif result.error == "expired":
+            typing_effect(red + "2FA code expired. Login denied." + reset)
+        else:
+            typing_effect(red + "Invalid 2FA code. Login denied." + reset)
+        return False
     else:
         typing_effect(blue + "2FA is not enabled for this account." + reset)
         sleep()
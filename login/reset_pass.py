@@ -1,8 +1,9 @@
-import os, bcrypt
+import os
 from utils.auth import input_masking
+from utils.passwords import hash_password
 from db.audit import log_audit_event
 from itsdangerous import URLSafeTimedSerializer
-from connection.connect_redis import redis_client
+from utils.rate_limit import check_rate_limit
 from db.db_operations import find_documents, update_documents
 from utils.sendmail import send_email
 from utils.helpers import (
@@ -48,6 +49,7 @@ def send_reset_email(email):
         <a href="{reset_link}">Reset Password</a>
         <p>This link will expire in 5 minutes.</p>
         """,
+        sensitive=True,
     )
     return {"success": True, "message": "Password reset email sent"}
 
@@ -58,7 +60,7 @@ def reset_password(token, new_password):
     if not email:
         return {"success": False, "message": "Invalid or expired token"}
 
-    hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
+    hashed_password = hash_password(new_password)
     try:
         update_documents(
             "admin", {"email": email}, {"$set": {"password": hashed_password}}
@@ -74,18 +76,7 @@ def reset_terminal():
     email = input_quit_handle(green + "Enter your email: ")
     # May add prompt for secoundair password here:
 
-    rate_limit_key = f"rate_limit:reset:{email}"
-    if redis_client.get(rate_limit_key):
-        typing_effect(red + "Too many attempts. Please try again later." + reset)
-        sleep()
-        clear()
-        return
-
-    attempts = redis_client.incr(rate_limit_key)
-    if attempts == 1:
-        redis_client.expire(rate_limit_key, 300)
-
-    if attempts > 5:
+    if not check_rate_limit(f"reset:{email}", limit=5, window=300).allowed:
         typing_effect(
             red + "Too many attempts. Please try again after 5 minutes." + reset
         )
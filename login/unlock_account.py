@@ -1,7 +1,7 @@
 import os
 from db.audit import log_audit_event
 from itsdangerous import URLSafeTimedSerializer
-from connection.connect_redis import redis_client
+from utils.rate_limit import check_rate_limit
 from db.db_operations import find_documents, update_documents
 from utils.sendmail import send_email
 from utils.helpers import (
@@ -48,6 +48,7 @@ def send_unlock_account(email):
         <a href="{unlock_link}">Unlock Account</a>
         <p>This link will expire in 5 minutes.</p>
         """,
+        sensitive=True,
     )
     return {"success": True, "message": "Unlock email sent"}
 
@@ -59,6 +60,11 @@ def unlock_account(token):
         print("Failed to confirm token")
         return {"success": False, "message": "Invalid or expired token"}
 
+    return unlock_admin(email)
+
+
+def unlock_admin(email):
+
     try:
         update_documents("admin", {"email": email}, {"$set": {"account_locked": False}})
         return {"success": True, "message": "Account unlocked successfully"}
@@ -72,18 +78,7 @@ def unlock_terminal():
 
     email = input_quit_handle("Enter the email to unlock: ")
 
-    rate_limit_key = f"rate_limit:unlock:{email}"
-    if redis_client.get(rate_limit_key):
-        typing_effect(red + "Too many attempts. Please try again later." + reset)
-        sleep()
-        return
-
-    # Increment attempts
-    attempts = redis_client.incr(rate_limit_key)
-    if attempts == 1:
-        redis_client.expire(rate_limit_key, 300)
-
-    if attempts > 5:
+    if not check_rate_limit(f"unlock:{email}", limit=5, window=300).allowed:
         typing_effect(
             red + "Too many attempts. Please try again after 5 minutes." + reset
         )
@@ -1,6 +1,7 @@
-from login.login import login
-from login.reset_pass import reset_terminal
-from login.unlock_account import unlock_terminal
+# Entry point. Only the helpers are imported up front: the login chain
+# (pymongo, redis, bcrypt, jwt, ...) is imported when a menu option is
+# picked, so the menu shows up immediately. Check with bench_startup.py.
+import os
 from utils.helpers import (
     input_quit_handle,
     typing_effect,
@@ -13,6 +14,25 @@ from utils.helpers import (
 )
 
 
+_indexes_ensured = False
+
+
+def _ensure_indexes():
+
+    # Every menu option needs Mongo, so the check runs once, right before
+    # the first one; the menu itself never opens a connection.
+    # MAIN_ENSURE_INDEXES=false skips it; it is read only after
+    # connect_db has loaded .env
+    global _indexes_ensured
+    if _indexes_ensured:
+        return
+    from connection.connect_db import ensure_indexes
+
+    if os.getenv("MAIN_ENSURE_INDEXES", "true").lower() == "true":
+        ensure_indexes()
+    _indexes_ensured = True
+
+
 def main():
     # Testing:
     print(blue + "welcome to the testing ground!" + reset)
@@ -28,13 +48,22 @@ def main():
         ).strip()
 
         if action == "1":
+            from login.login import login
+
             clear()
+            _ensure_indexes()
             login()
         elif action == "2":
+            from login.reset_pass import reset_terminal
+
             clear()
+            _ensure_indexes()
             reset_terminal()
         elif action == "3":
+            from login.unlock_account import unlock_terminal
+
             clear()
+            _ensure_indexes()
             unlock_terminal()
         elif action == "4":
             handle_quit()
@@ -1,12 +1,29 @@
 # MongoDB connection / collections and populate the DB with data from json.
 
 import json
+import time
+import argparse
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from utils.helpers import green, red, blue, reset
-from db.db_operations import insert_document
+from db.db_operations import insert_documents, BULK_BATCH_SIZE
 from connection.connect_db import MONGO_COLLECTIONS
 
 DATA_FOLDER = Path("./data")
+READ_CHUNK_SIZE = 1 << 16
+# MongoDB's own document limit; a bigger one is a broken file, not a
+# reason to keep reading it into memory
+MAX_DOCUMENT_SIZE = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 5.0
+
+_decoder = json.JSONDecoder()
+_print_lock = threading.Lock()
+
+
+def _print(message):
+    with _print_lock:
+        print(message)
 
 
 def load_json(file_path: Path) -> list:
@@ -24,24 +41,214 @@ def load_json(file_path: Path) -> list:
         return []
 
 
-def seed_collection(collection_key: str, data: list):
+def _needs_more(error, buffer):
+
+    # More data can only fix an error at the very end of the buffer (a cut
+    # literal, number or escape) or a string still open there; anything
+    # else is a malformed document
+    return len(buffer) - error.pos <= 16 or error.msg.startswith(
+        "Unterminated string"
+    )
+
+
+def iter_json(file_path: Path, chunk_size: int = READ_CHUNK_SIZE):
+    # Yields documents one by one from a JSON array, a single JSON object or
+    # NDJSON, reading the file in chunks so memory stays flat.
+
+    with open(file_path, "r") as file:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = file.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip(chars):
+            # Skip separators, pulling more data if the buffer runs out.
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        skip(" \t\r\n")
+        if pos >= len(buffer):
+            return
+
+        in_array = buffer[pos] == "["
+        if in_array:
+            pos += 1
+        separators = " \t\r\n," if in_array else " \t\r\n"
+
+        while True:
+            skip(separators)
+            if pos >= len(buffer):
+                if in_array:
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                return
+            if in_array and buffer[pos] == "]":
+                return
+
+            try:
+                document, end = _decoder.raw_decode(buffer, pos)
+                # A number may be cut short by the chunk edge ("45" of "45.6"),
+                # so only trust it once a delimiter follows.
+                cut_short = end >= len(buffer) or (
+                    isinstance(document, (int, float))
+                    and buffer[end] not in " \t\r\n,]"
+                )
+                if cut_short and not eof:
+                    raise json.JSONDecodeError("Need more data", buffer, end)
+            except json.JSONDecodeError as e:
+                if not _needs_more(e, buffer):
+                    raise
+                if len(buffer) - pos > MAX_DOCUMENT_SIZE:
+                    raise json.JSONDecodeError(
+                        f"Document larger than {MAX_DOCUMENT_SIZE} bytes", buffer, pos
+                    )
+                if fill():
+                    continue
+                if eof and pos < len(buffer):
+                    document, end = _decoder.raw_decode(buffer, pos)
+                else:
+                    raise
+            pos = end
+            yield document
+
+
+def _with_progress(documents, collection_key, interval=PROGRESS_INTERVAL):
+
+    started = last = time.perf_counter()
+    count = 0
+    for document in documents:
+        count += 1
+        now = time.perf_counter()
+        if now - last >= interval:
+            _print(
+                blue
+                + f"{collection_key}: {count} rows read, "
+                + f"{count / (now - started):.0f} rows/sec"
+                + reset
+            )
+            last = now
+        yield document
+
+
+def seed_collection(collection_key: str, data, batch_size: int = BULK_BATCH_SIZE):
 
     if not data:
         print(blue + f"No data to seed for collection: {collection_key}" + reset)
         return
-    for document in data:
-        insert_document(collection_key, document)
-    print(green + f"Seeded {len(data)} document(s) into {collection_key}" + reset)
+    report = insert_documents(collection_key, data, batch_size=batch_size)
+    print(
+        green
+        + f"Seeded {report['inserted']} document(s) into {collection_key}"
+        + f" in {report['batches']} batch(es)"
+        + reset
+    )
+    for error in report["errors"]:
+        print(
+            red + f"Batch {error.get('batch')} errors: {error['errors'][:5]}" + reset
+        )
+
+
+def find_data_file(collection_key: str):
+
+    for suffix in (".json", ".ndjson", ".jsonl"):
+        path = DATA_FOLDER / f"{collection_key}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def stream_collection(collection_key: str, batch_size: int = BULK_BATCH_SIZE):
+
+    json_file = find_data_file(collection_key)
+    if json_file is None:
+        _print(blue + f"No data to seed for collection: {collection_key}" + reset)
+        return None
+
+    _print(blue + f"Streaming {collection_key} from {json_file.name},..." + reset)
+    started = time.perf_counter()
+    documents = _with_progress(iter_json(json_file), collection_key)
+    report = insert_documents(collection_key, documents, batch_size=batch_size)
+    # bulk_write() catches what the generator raises (bad JSON, unreadable
+    # file) and records it as a batch-less error; earlier batches are kept
+    aborted = [error for error in report["errors"] if error.get("batch") is None]
+    if aborted:
+        _print(
+            red
+            + f"Failed to seed {collection_key} from {json_file} after "
+            + f"{report['inserted']} document(s): "
+            + f"{aborted[0]['errors'][0]['message']}"
+            + reset
+        )
+        return None
+
+    elapsed = time.perf_counter() - started
+    rate = report["inserted"] / elapsed if elapsed else 0
+    _print(
+        green
+        + f"Seeded {report['inserted']} document(s) into {collection_key}"
+        + f" in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        + reset
+    )
+    for error in report["errors"]:
+        _print(
+            red + f"Batch {error.get('batch')} errors: {error['errors'][:5]}" + reset
+        )
+    return report
+
+
+def stream_all(batch_size: int = BULK_BATCH_SIZE, workers: int = None):
+
+    collection_keys = list(MONGO_COLLECTIONS.keys())
+    with ThreadPoolExecutor(max_workers=workers or len(collection_keys)) as pool:
+        reports = pool.map(
+            lambda key: stream_collection(key, batch_size), collection_keys
+        )
+        return dict(zip(collection_keys, reports))
 
 
 def main():
 
+    parser = argparse.ArgumentParser(description="Seed MongoDB from ./data")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream JSON/NDJSON files and seed collections concurrently",
+    )
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.stream:
+        reports = stream_all(batch_size=args.batch_size, workers=args.workers)
+        failed = [
+            key
+            for key, report in reports.items()
+            if report is None and find_data_file(key) is not None
+        ]
+        if failed:
+            print(red + f"Database seeding failed for: {', '.join(failed)}" + reset)
+            return
+        print(green + "Database seeding completed successfully!" + reset)
+        return
+
     for collection_key in MONGO_COLLECTIONS.keys():
         json_file = DATA_FOLDER / f"{collection_key}.json"
 
         print(blue + f"Processing {collection_key} from {json_file.name},..." + reset)
         data = load_json(json_file)
-        seed_collection(collection_key, data)
+        seed_collection(collection_key, data, batch_size=args.batch_size)
 
     print(green + "Database seeding completed successfully!" + reset)
 
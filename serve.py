@@ -0,0 +1,127 @@
+# Production entry point: pre-forked gunicorn workers instead of app.run().
+#
+#   python serve.py            -> backend:app on sync/threaded workers
+#   python serve.py --async    -> backend_async:app on uvicorn workers
+#
+# The app is imported once in the master (preload) and forked into workers.
+# kill -HUP <master> reloads workers gracefully, kill -TERM drains in-flight
+# requests for WEB_GRACEFUL_TIMEOUT seconds before exiting.
+#
+# Process count: 1 master + WEB_WORKERS workers (default 2 * cores + 1).
+# bcrypt gets cores // WEB_WORKERS extra processes per worker, i.e. none by
+# default: it runs on the worker's threads (it releases the GIL), so at most
+# WEB_WORKERS * WEB_THREADS hashes run at once. Set PASSWORD_WORKERS to
+# give every worker its own pool instead.
+import os
+import sys
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+from utils.helpers import green, reset
+
+load_dotenv()
+
+WEB_BIND = os.getenv("WEB_BIND", "127.0.0.1:5000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+WEB_KEEPALIVE = int(os.getenv("WEB_KEEPALIVE", "5"))
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "30"))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+# utils.passwords sizes its pool from this
+os.environ["WEB_WORKERS"] = str(WEB_WORKERS)
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def when_ready(server):
+
+    # Once, in the master, before any worker exists
+    from connection.connect_db import ensure_indexes, close_client
+    from utils.passwords import get_rounds
+
+    ensure_indexes()
+    close_client()
+    # Calibrate bcrypt once; workers inherit the result
+    get_rounds()
+
+
+def post_fork(server, worker):
+
+    # Never share sockets or background threads with the master: every
+    # worker builds its own Mongo and Redis pools on first use
+    from connection.connect_db import close_client
+    from connection.connect_redis import reset_pools
+    from utils.session import start_session_listener
+
+    close_client()
+    reset_pools()
+    # Needed before sessions are trusted from the local cache
+    start_session_listener()
+    logger.info(green + f"Worker {worker.pid} ready" + reset)
+
+
+def worker_exit(server, worker):
+
+    from db.audit import audit_writer
+    from utils.sendmail import mail_outbox
+
+    audit_writer.close()
+    mail_outbox.close()
+
+
+class Server(BaseApplication):
+
+    def __init__(self, app_uri, options):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        module_name, _, attr = self.app_uri.partition(":")
+        module = __import__(module_name)
+        return getattr(module, attr)
+
+
+def options(use_async=False):
+
+    opts = {
+        "bind": WEB_BIND,
+        "workers": WEB_WORKERS,
+        "preload_app": True,
+        "keepalive": WEB_KEEPALIVE,
+        "timeout": WEB_TIMEOUT,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT,
+        # Recycle workers now and then, jittered so they don't restart together
+        "max_requests": WEB_MAX_REQUESTS,
+        "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }
+    if use_async:
+        opts["worker_class"] = "uvicorn.workers.UvicornWorker"
+    else:
+        opts["worker_class"] = "gthread"
+        opts["threads"] = WEB_THREADS
+    return opts
+
+
+def main():
+
+    use_async = "--async" in sys.argv
+    app_uri = "backend_async:app" if use_async else "backend:app"
+    logger.info(green + f"Serving {app_uri} on {WEB_BIND}" + reset)
+    Server(app_uri, options(use_async)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,20 @@
 # For auth functions
 import json
 import hashlib
-import bcrypt
-import requests
-import platform
-import subprocess
 
 # from pathlib import Path
 from colorama import Style
-import os, re, time, getpass, msvcrt
-from models.all_models import RegisterModel
+import os, time, getpass
 from db.db_operations import find_documents, update_documents
-from pydantic import ValidationError, BaseModel
 from utils.helpers import red, blue, reset, input_quit_handle
 from utils.sendmail import send_email
+from utils.passwords import hash_password
+from utils.fingerprint import (
+    get_fingerprint,
+    degraded_probes,
+    normalize_system_info,
+    fingerprint_digest,
+)
 
 
 def input_masking(prompt, delay=0.02, typing_effect=False, color=None):
@@ -38,6 +39,8 @@ def input_masking(prompt, delay=0.02, typing_effect=False, color=None):
 
     # For Windows input masking.
     if os.name == "nt":
+        import msvcrt  # Windows only
+
         while True:
             char = msvcrt.getch()  # Get a single character from the user.
 
@@ -67,148 +70,19 @@ def input_masking(prompt, delay=0.02, typing_effect=False, color=None):
     return user_input
 
 
-def get_system_info():
+def get_system_info(refresh=False):
 
-    try:
-        # MAC Addresses
-        mac_addresses = []
-        try:
-            if platform.system() == "Windows":
-                # Windows: Get MAC addresses using PowerShell
-                command = (
-                    'powershell -Command "Get-NetAdapter | '
-                    'Select-Object -ExpandProperty MacAddress"'
-                )
-                output = subprocess.check_output(command, shell=True).decode().strip()
-                mac_addresses = [
-                    mac.replace("-", ":").strip() for mac in output.splitlines() if mac
-                ]
-            else:
-                # Linux/Mac: Get MAC addresses using ip link or ifconfig
-                try:
-                    output = subprocess.check_output("ip link", shell=True).decode()
-                    mac_matches = re.findall(
-                        r"([0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}", output
-                    )
-                    mac_addresses = list(set(mac_matches))
-                except Exception:
-                    output = subprocess.check_output("ifconfig", shell=True).decode()
-                    mac_matches = re.findall(
-                        r"([0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}", output
-                    )
-                    mac_addresses = list(set(mac_matches))
-            mac_addresses = list(filter(None, mac_addresses))  # Remove empty entries
-        except Exception as e:
-            print(red + f"Error fetching MAC addresses: {e}" + reset)
-
-        # Drives (HDD/SSD Serial Numbers)
-        drives = []
-        try:
-            if platform.system() == "Windows":
-                # Windows: Get drives using WMIC
-                output = subprocess.check_output(
-                    "wmic diskdrive get SerialNumber,Model", shell=True
-                ).decode()
-                for line in output.splitlines()[1:]:
-                    if line.strip():
-                        model, serial = line.strip().rsplit(None, 1)
-                        drives.append({"model": model, "serial": serial})
-            else:
-                # Linux: Get drives using lsblk
-                output = subprocess.check_output(
-                    "lsblk -o NAME,SERIAL", shell=True
-                ).decode()
-                for line in output.splitlines()[1:]:
-                    if line.strip():
-                        parts = line.split()
-                        if len(parts) == 2:
-                            drives.append({"model": parts[0], "serial": parts[1]})
-        except Exception as e:
-            print(red + f"Error fetching HDD/SSD serial numbers: {e}" + reset)
-
-        # Motherboard Serial Number
-        motherboard_serial = "Unknown"
-        try:
-            if platform.system() == "Windows":
-                # Windows: Get motherboard serial using WMIC
-                motherboard_serial = (
-                    subprocess.check_output(
-                        "wmic baseboard get serialnumber", shell=True
-                    )
-                    .decode()
-                    .split("\n")[1]
-                    .strip()
-                )
-            else:
-                # Linux: Read from system files
-                motherboard_serial = (
-                    subprocess.check_output(
-                        "cat /sys/class/dmi/id/board_serial", shell=True
-                    )
-                    .decode()
-                    .strip()
-                )
-        except Exception as e:
-            print(red + f"Error fetching motherboard serial: {e}" + reset)
-
-        # Location (Latitude and Longitude)
-        latitude, longitude = "Unknown", "Unknown"
-        try:
-            response = requests.get("https://ipinfo.io/json", timeout=5)
-            if response.status_code == 200:
-                location = response.json().get("loc", "Unknown")
-                if location != "Unknown":
-                    latitude, longitude = location.split(",")
-        except Exception as e:
-            print(red + f"Error fetching location: {e}" + reset)
-
-        # Return System Info
-        return {
-            "mac_addresses": mac_addresses,
-            "drives": drives,
-            "motherboard_serial": motherboard_serial,
-            "latitude": latitude,
-            "longitude": longitude,
-        }
-    except Exception as e:
-        print(f"Error fetching system info: {e}")
-        return {
-            "mac_addresses": [],
-            "drives": [],
-            "motherboard_serial": "Unknown",
-            "latitude": "Unknown",
-            "longitude": "Unknown",
-        }
-
-
-def normalize_system_info(info):
-
-    if isinstance(info, list):  # If it's a list, normalize each entry
-        return [
-            {
-                "mac_addresses": sorted(entry.get("mac_addresses", [])),
-                "drives": sorted(
-                    entry.get("drives", []), key=lambda d: d.get("serial", "")
-                ),
-                "latitude": round(float(entry.get("latitude", "0")), 4),
-                "longitude": round(float(entry.get("longitude", "0")), 4),
-                "motherboard_serial": entry.get("motherboard_serial", ""),
-            }
-            for entry in info
-        ]
-    elif isinstance(info, dict):  # If it's a single dictionary, normalize it
-        return {
-            "mac_addresses": sorted(info.get("mac_addresses", [])),
-            "drives": sorted(info.get("drives", []), key=lambda d: d.get("serial", "")),
-            "latitude": round(float(info.get("latitude", "0")), 4),
-            "longitude": round(float(info.get("longitude", "0")), 4),
-            "motherboard_serial": info.get("motherboard_serial", ""),
-        }
-    else:
-        raise TypeError("Input must be a dictionary or a list of dictionaries")
+    # Collected once per process (see utils/fingerprint.py)
+    return get_fingerprint(refresh=refresh)
+
+
+def validation_field(field_name: str, value: str, model=None):
 
+    # pydantic and the models are only needed by admin input validation
+    from pydantic import ValidationError, BaseModel
 
-def validation_field(field_name: str, value: str, model=RegisterModel):
+    if model is None:
+        from models.all_models import RegisterModel as model
 
     if field_name not in model.model_fields:
         return blue + f"Unknown field: {field_name}{reset}"
@@ -226,7 +100,7 @@ def validation_field(field_name: str, value: str, model=RegisterModel):
         return red + f"Validation error for '{field_name}': {error_message}{reset}"
 
 
-def validation_input(prompt, field_name, min_length=None, model=RegisterModel):
+def validation_input(prompt, field_name, min_length=None, model=None):
     while True:
         user_input = input_quit_handle(prompt).strip()
 
@@ -272,7 +146,7 @@ def sha256_encrypt(data: str) -> str:
 
 
 def bcrypt_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return hash_password(password)
 
 
 # def store_log(data: dict, file_path: Path):
@@ -0,0 +1,292 @@
+# Hardware fingerprint for login verification.
+# On Linux everything local is read straight from sysfs (no shells); the
+# probes run concurrently, each with its own timeout, and the result is
+# cached for the process.
+import os
+import re
+import copy
+import glob
+import json
+import hashlib
+import time
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+from utils.helpers import red, reset
+
+# Seconds to keep a collected fingerprint (0 = for the life of the process)
+FINGERPRINT_TTL = float(os.getenv("FINGERPRINT_TTL", "0"))
+FINGERPRINT_PROBE_TIMEOUT = float(os.getenv("FINGERPRINT_PROBE_TIMEOUT", "2"))
+FINGERPRINT_LOCATION_TIMEOUT = float(os.getenv("FINGERPRINT_LOCATION_TIMEOUT", "5"))
+FINGERPRINT_LOCATION_URL = os.getenv(
+    "FINGERPRINT_LOCATION_URL", "https://ipinfo.io/json"
+)
+
+_MAC_RE = re.compile(r"(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}")
+# Virtual block devices that have no serial worth pinning
+_SKIP_BLOCK = ("loop", "ram", "zram", "dm-", "md", "sr", "nbd")
+
+_cache = None
+_cached_at = 0.0
+_timings = {}
+_lock = threading.Lock()
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _run(args, timeout=FINGERPRINT_PROBE_TIMEOUT):
+    return subprocess.check_output(args, timeout=timeout).decode()
+
+
+# ---- Probes --->
+
+
+def probe_mac_addresses():
+
+    if platform.system() == "Windows":
+        command = "Get-NetAdapter | Select-Object -ExpandProperty MacAddress"
+        output = _run(["powershell", "-Command", command])
+        return [mac.replace("-", ":").strip() for mac in output.splitlines() if mac]
+
+    # Linux exposes every interface's address in sysfs
+    macs = set()
+    for path in glob.glob("/sys/class/net/*/address"):
+        try:
+            mac = _read(path).lower()
+        except OSError:
+            continue
+        if _MAC_RE.fullmatch(mac) and mac != "00:00:00:00:00:00":
+            macs.add(mac)
+    if macs or os.path.isdir("/sys/class/net"):
+        return sorted(macs)
+
+    # No sysfs (macOS / BSD)
+    output = _run(["ifconfig"])
+    return sorted({mac.lower() for mac in _MAC_RE.findall(output)})
+
+
+def _udev_serial(name):
+
+    # What lsblk reports: ID_SERIAL_SHORT from the udev database
+    try:
+        major_minor = _read(f"/sys/block/{name}/dev")
+        with open(f"/run/udev/data/b{major_minor}") as f:
+            for line in f:
+                if line.startswith("E:ID_SERIAL_SHORT="):
+                    return line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def probe_drives():
+
+    if platform.system() == "Windows":
+        output = _run(["wmic", "diskdrive", "get", "SerialNumber,Model"])
+        drives = []
+        for line in output.splitlines()[1:]:
+            if line.strip():
+                model, serial = line.strip().rsplit(None, 1)
+                drives.append({"model": model, "serial": serial})
+        return drives
+
+    drives = []
+    for path in sorted(glob.glob("/sys/block/*")):
+        name = os.path.basename(path)
+        if name.startswith(_SKIP_BLOCK):
+            continue
+        serial = None
+        try:
+            serial = _read(f"{path}/device/serial")
+        except OSError:
+            pass
+        serial = serial or _udev_serial(name)
+        if serial:
+            drives.append({"model": name, "serial": serial})
+    return drives
+
+
+def probe_motherboard_serial():
+
+    if platform.system() == "Windows":
+        output = _run(["wmic", "baseboard", "get", "serialnumber"])
+        return output.split("\n")[1].strip()
+    # Usually root-only. That answer never changes for a given user, so it
+    # is a result ("Unknown"), not a failed probe
+    try:
+        return _read("/sys/class/dmi/id/board_serial")
+    except (FileNotFoundError, PermissionError):
+        return "Unknown"
+
+
+def probe_location():
+
+    import requests
+
+    response = requests.get(
+        FINGERPRINT_LOCATION_URL, timeout=FINGERPRINT_LOCATION_TIMEOUT
+    )
+    location = response.json().get("loc", "Unknown") if response.ok else "Unknown"
+    if location == "Unknown":
+        return "Unknown", "Unknown"
+    latitude, longitude = location.split(",")
+    return latitude, longitude
+
+
+# name: (probe, timeout, fallback)
+PROBES = {
+    "mac_addresses": (probe_mac_addresses, FINGERPRINT_PROBE_TIMEOUT, []),
+    "drives": (probe_drives, FINGERPRINT_PROBE_TIMEOUT, []),
+    "motherboard_serial": (
+        probe_motherboard_serial,
+        FINGERPRINT_PROBE_TIMEOUT,
+        "Unknown",
+    ),
+    "location": (probe_location, FINGERPRINT_LOCATION_TIMEOUT, ("Unknown", "Unknown")),
+}
+
+
+def _timed(probe):
+
+    started = time.perf_counter()
+    try:
+        return probe(), None, started
+    except Exception as e:
+        return None, e, started
+
+
+def collect(probes=PROBES):
+
+    # Returns (results, timings); a probe that fails or runs past its
+    # timeout gets its fallback value
+    results, timings = {}, {}
+    executor = ThreadPoolExecutor(max_workers=len(probes))
+    submitted = time.perf_counter()
+    futures = {
+        name: executor.submit(_timed, probe) for name, (probe, _, _) in probes.items()
+    }
+    try:
+        for name, (_, timeout, fallback) in probes.items():
+            remaining = timeout - (time.perf_counter() - submitted)
+            done, _ = wait([futures[name]], timeout=max(remaining, 0))
+            if not done:
+                results[name] = fallback
+                timings[name] = {"ms": round(timeout * 1000, 1), "status": "timeout"}
+                print(red + f"Fingerprint probe '{name}' timed out" + reset)
+                continue
+            value, error, started = futures[name].result()
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            if error is not None:
+                results[name] = fallback
+                timings[name] = {"ms": elapsed_ms, "status": "error"}
+                print(red + f"Error fetching {name}: {error}" + reset)
+            else:
+                results[name] = value
+                timings[name] = {"ms": elapsed_ms, "status": "ok"}
+    finally:
+        # Never wait on a hung probe; its thread finishes in the background
+        executor.shutdown(wait=False)
+    return results, timings
+
+
+def get_fingerprint(refresh=False):
+
+    # Only complete results are cached: one slow or failed probe must not
+    # pin a fallback value (and so a wrong digest) for the whole process
+    global _cache, _cached_at, _timings
+    with _lock:
+        fresh = _cache is not None and (
+            FINGERPRINT_TTL <= 0 or time.monotonic() - _cached_at < FINGERPRINT_TTL
+        )
+        if fresh and not refresh:
+            return copy.deepcopy(_cache)
+
+        started = time.perf_counter()
+        results, timings = collect()
+        timings["total"] = {
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "status": "ok",
+        }
+        latitude, longitude = results.pop("location")
+        fingerprint = {**results, "latitude": latitude, "longitude": longitude}
+        _timings = timings
+        if not degraded_probes():
+            _cache = fingerprint
+            _cached_at = time.monotonic()
+        return copy.deepcopy(fingerprint)
+
+
+def degraded_probes():
+
+    # Probes that timed out or failed in the last collection
+    return [
+        name
+        for name, timing in _timings.items()
+        if name != "total" and timing["status"] != "ok"
+    ]
+
+
+def get_probe_timings():
+    return dict(_timings)
+
+
+def clear_fingerprint_cache():
+
+    global _cache
+    with _lock:
+        _cache = None
+
+
+# ---- Comparing fingerprints --->
+
+
+def _coordinate(value):
+
+    # Rounded to ~11 m; a failed location lookup ("Unknown") counts as None
+    try:
+        return round(float(value), 4)
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize(entry):
+    return {
+        "mac_addresses": sorted(entry.get("mac_addresses", [])),
+        "drives": sorted(entry.get("drives", []), key=lambda d: d.get("serial", "")),
+        "latitude": _coordinate(entry.get("latitude", "0")),
+        "longitude": _coordinate(entry.get("longitude", "0")),
+        "motherboard_serial": entry.get("motherboard_serial", ""),
+    }
+
+
+def normalize_system_info(info):
+
+    if isinstance(info, list):  # If it's a list, normalize each entry
+        return [_normalize(entry) for entry in info]
+    elif isinstance(info, dict):  # If it's a single dictionary, normalize it
+        return _normalize(info)
+    else:
+        raise TypeError("Input must be a dictionary or a list of dictionaries")
+
+
+def fingerprint_digest(info):
+
+    # sha256 over the canonical JSON of the normalized fingerprint: equal
+    # digests <=> normalize_system_info() of both sides compares equal
+    canonical = json.dumps(
+        _normalize(info), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+if __name__ == "__main__":
+    # python -m utils.fingerprint  -> fingerprint and per-probe timings
+    fingerprint = get_fingerprint()
+    print(json.dumps(fingerprint, indent=4))
+    print(f"digest: {fingerprint_digest(fingerprint)}")
+    for probe, timing in get_probe_timings().items():
+        print(f"{probe:<20} {timing['ms']:>8} ms  {timing['status']}")
@@ -0,0 +1,206 @@
+# Password hashing on a process pool, so bcrypt never blocks the caller's
+# interpreter (or the whole server) while it burns CPU.
+import os
+import time
+import math
+import bisect
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from dotenv import load_dotenv
+from utils.helpers import green, red, reset
+
+load_dotenv()
+
+# Hashing processes per process that hashes (unset = cores / WEB_WORKERS;
+# 0 = hash on the calling thread, bcrypt releases the GIL while it runs)
+PASSWORD_WORKERS = os.getenv("PASSWORD_WORKERS")
+# Calibrate rounds so one hash takes about this long (ms)
+PASSWORD_TARGET_MS = float(os.getenv("PASSWORD_TARGET_MS", "250"))
+# Fixed rounds instead of calibrating (0 = calibrate)
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "0"))
+# Never below bcrypt.gensalt()'s default, whatever the host measures
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+# Calibration times a few cheap hashes and extrapolates
+CALIBRATION_ROUNDS = 8
+CALIBRATION_SAMPLES = 5
+
+# Histogram bucket upper bounds in ms (last bucket is everything above)
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+# ---- Runs inside the worker processes --->
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        return False
+
+
+# ---- Pool, calibration and stats --->
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_rounds = max(PASSWORD_BCRYPT_ROUNDS, MIN_ROUNDS) if PASSWORD_BCRYPT_ROUNDS else None
+
+_stats_lock = threading.Lock()
+_histograms = {
+    "hash": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+    "verify": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+}
+
+
+def pool_size():
+
+    # The cores are shared by every web worker, so under serve.py each one
+    # gets cores // WEB_WORKERS hashing processes, which is usually 0: the
+    # web worker's own threads hash and the host never runs more bcrypt
+    # processes than it has web workers
+    if PASSWORD_WORKERS:
+        return int(PASSWORD_WORKERS)
+    web_workers = int(os.getenv("WEB_WORKERS") or 1)
+    return (os.cpu_count() or 1) // web_workers
+
+
+def _get_pool():
+
+    # One pool per process; a forked child builds its own. None means hash
+    # inline
+    global _pool, _pool_pid
+    if pool_size() == 0:
+        return None
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=pool_size())
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _run(func, *args):
+    pool = _get_pool()
+    return func(*args) if pool is None else pool.submit(func, *args).result()
+
+
+def _observe(operation, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _stats_lock:
+        _histograms[operation][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+
+def calibrate_rounds(target_ms=PASSWORD_TARGET_MS):
+
+    # Each extra round doubles the cost, so time a few hashes at
+    # CALIBRATION_ROUNDS and extrapolate. The fastest sample is the least
+    # disturbed by other load; the result is clamped to MIN_ROUNDS, so a
+    # slow or busy host never gets weaker hashes than the bcrypt default.
+    samples = []
+    for _ in range(CALIBRATION_SAMPLES):
+        started = time.perf_counter()
+        _hash(b"calibration", CALIBRATION_ROUNDS)
+        samples.append((time.perf_counter() - started) * 1000)
+    base_ms = max(min(samples), 0.001)
+    rounds = CALIBRATION_ROUNDS + round(math.log2(target_ms / base_ms))
+    rounds = min(max(rounds, MIN_ROUNDS), MAX_ROUNDS)
+    expected_ms = base_ms * 2 ** (rounds - CALIBRATION_ROUNDS)
+    logger.info(
+        green + f"bcrypt calibrated: {rounds} rounds (~{expected_ms:.0f} ms)" + reset
+    )
+    return rounds
+
+
+def get_rounds():
+
+    global _rounds
+    if _rounds is None:
+        with _pool_lock:
+            if _rounds is None:
+                _rounds = calibrate_rounds()
+    return _rounds
+
+
+def hash_password(password: str) -> str:
+
+    rounds = get_rounds()
+    started = time.perf_counter()
+    try:
+        hashed = _run(_hash, password.encode(), rounds)
+    finally:
+        _observe("hash", started)
+    return hashed.decode()
+
+
+def verify_password(password: str, hashed: str) -> bool:
+
+    started = time.perf_counter()
+    try:
+        return _run(_check, password.encode(), hashed.encode())
+    finally:
+        _observe("verify", started)
+
+
+def hash_rounds(hashed: str) -> int:
+
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_rounds(hashed) < get_rounds()
+
+
+def verify_and_rehash(password: str, hashed: str):
+
+    # Returns (valid, new_hash); new_hash is set when the stored cost is
+    # below the current one and the caller should save it
+    if not verify_password(password, hashed):
+        return False, None
+    if needs_rehash(hashed):
+        try:
+            return True, hash_password(password)
+        except Exception as e:
+            logger.error(red + f"Failed to rehash password: {e}" + reset)
+    return True, None
+
+
+def get_password_stats():
+
+    labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [
+        f">{LATENCY_BUCKETS_MS[-1]}ms"
+    ]
+    with _stats_lock:
+        return {
+            "rounds": _rounds,
+            "workers": pool_size(),
+            "latency": {
+                operation: dict(zip(labels, counts))
+                for operation, counts in _histograms.items()
+            },
+        }
+
+
+def shutdown_pool():
+
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
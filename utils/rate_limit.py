@@ -0,0 +1,147 @@
+# Atomic rate limiting on Redis (one round trip per check)
+import os
+import uuid
+import logging
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+from connection.connect_redis import redis_client
+from utils.helpers import red, reset
+
+load_dotenv()
+
+RATE_LIMIT_PREFIX = os.getenv("RATE_LIMIT_PREFIX", "ratelimit:")
+# Allow requests when Redis is unreachable (default: deny)
+RATE_LIMIT_FAIL_OPEN = os.getenv("RATE_LIMIT_FAIL_OPEN", "false").lower() == "true"
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple("RateLimitResult", "allowed remaining retry_after")
+
+# Sliding window log: one sorted-set entry per hit within the window.
+# KEYS[1] key, ARGV: limit, window (ms), unique member
+_SLIDING_WINDOW = """
+redis.replicate_commands()
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, now .. ':' .. ARGV[3])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, window - (now - tonumber(oldest[2]))}
+"""
+
+# Token bucket: refills `rate` tokens per second up to `capacity`.
+# KEYS[1] key, ARGV: rate, capacity, cost
+_TOKEN_BUCKET = """
+redis.replicate_commands()
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = math.ceil((cost - tokens) / rate * 1000)
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+return {allowed, math.floor(tokens), retry}
+"""
+
+_SOURCES = {"sliding": _SLIDING_WINDOW, "token_bucket": _TOKEN_BUCKET}
+_scripts = {}
+_scripts_lock = threading.Lock()
+
+
+def _script(name):
+
+    # Registered on first use so importing this module costs nothing
+    script = _scripts.get(name)
+    if script is None:
+        if name not in _SOURCES:
+            raise ValueError(f"Unknown rate limit algorithm: {name}")
+        with _scripts_lock:
+            script = _scripts.setdefault(
+                name, redis_client.register_script(_SOURCES[name])
+            )
+    return script
+
+
+def _result(raw):
+    allowed, remaining, retry_ms = raw
+    return RateLimitResult(bool(allowed), int(remaining), int(retry_ms) / 1000)
+
+
+def _failed(key, error):
+    logger.error(red + f"Rate limit check failed for {key}: {error}" + reset)
+    return RateLimitResult(RATE_LIMIT_FAIL_OPEN, 0, 0)
+
+
+def _args(algorithm, limit, window, cost):
+
+    # Script args for either algorithm; for the token bucket `limit` is the
+    # capacity and `window` the time to refill it completely
+    if algorithm == "sliding":
+        return [limit, int(window * 1000), uuid.uuid4().hex]
+    return [limit / window, limit, cost]
+
+
+def check_rate_limit(key, limit, window, algorithm="sliding", cost=1):
+
+    # Counts the hit against the limit only when it is allowed
+    try:
+        script = _script(algorithm)
+        raw = script(
+            keys=[RATE_LIMIT_PREFIX + key], args=_args(algorithm, limit, window, cost)
+        )
+        return _result(raw)
+    except Exception as e:
+        return _failed(key, e)
+
+
+async def check_rate_limit_async(
+    client, key, limit, window, algorithm="sliding", cost=1
+):
+
+    # Same check on a redis.asyncio client, for the async backend
+    if algorithm not in _SOURCES:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    try:
+        script = client.register_script(_SOURCES[algorithm])
+        raw = await script(
+            keys=[RATE_LIMIT_PREFIX + key], args=_args(algorithm, limit, window, cost)
+        )
+        return _result(raw)
+    except Exception as e:
+        return _failed(key, e)
+
+
+def reset_rate_limit(key):
+
+    try:
+        redis_client.delete(RATE_LIMIT_PREFIX + key)
+    except Exception as e:
+        logger.error(red + f"Failed to reset rate limit for {key}: {e}" + reset)
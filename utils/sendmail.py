@@ -1,13 +1,55 @@
 import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import atexit
 import logging
 import smtplib
+import threading
 from email.mime.text import MIMEText
-from utils.helpers import green, red, reset
+from utils.helpers import green, red, blue, reset
 from email.mime.multipart import MIMEMultipart
 from itsdangerous import URLSafeTimedSerializer
+from connection.connect_redis import redis_client
 
 serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"))
 
+# SMTP settings. For a local stand-in run e.g.
+#   python -m aiosmtpd -n -l 127.0.0.1:1025
+# with SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_SSL=false and no SMTP_PASS.
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() == "true"
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+
+# Outbox settings
+MAIL_OUTBOX = os.getenv("MAIL_OUTBOX", "true").lower() == "true"
+# Run a sender thread inside every process that enqueues mail
+MAIL_WORKER_IN_PROCESS = (
+    os.getenv("MAIL_WORKER_IN_PROCESS", "true").lower() == "true"
+)
+MAIL_QUEUE_KEY = os.getenv("MAIL_QUEUE_KEY", "mail:outbox")
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "1"))
+# Close the SMTP connection after this long without sending (s)
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "30"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", "5"))
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", "600"))
+# Undeliverable mail kept for inspection: newest MAIL_DEAD_MAX entries, and
+# the list expires MAIL_DEAD_TTL seconds after the last one was added
+MAIL_DEAD_MAX = int(os.getenv("MAIL_DEAD_MAX", "1000"))
+MAIL_DEAD_TTL = int(os.getenv("MAIL_DEAD_TTL", str(7 * 24 * 3600)))
+# How long a process waits for its outbox to drain on exit (s)
+MAIL_FLUSH_TIMEOUT = float(os.getenv("MAIL_FLUSH_TIMEOUT", "10"))
+
+_RETRY_KEY = MAIL_QUEUE_KEY + ":retry"
+_DEAD_KEY = MAIL_QUEUE_KEY + ":dead"
+_PROCESSING_PREFIX = MAIL_QUEUE_KEY + ":processing:"
+_ALIVE_PREFIX = MAIL_QUEUE_KEY + ":alive:"
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,26 +67,390 @@ def confirm_token(token, salt="email-confirm-salt", expiration=300):
     return email
 
 
-def send_email(to_email, subject, body):
+def _sender():
+    return os.getenv("SMTP_FROM") or os.getenv("SMTP_USER")
+
+
+def build_message(to_email, subject, body):
+
+    message = MIMEMultipart()
+    message["From"] = _sender()
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "html"))
+    return message.as_string()
+
+
+class SMTPConnection:
+    # One authenticated connection reused across messages. It is dropped
+    # after MAIL_IDLE_TIMEOUT idle seconds (before the server does it) and
+    # reopened once when the server hangs up mid-send.
+
+    def __init__(self, idle_timeout=MAIL_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+
+        host = os.getenv("SMTP_HOST")
+        port = int(os.getenv("SMTP_PORT") or (465 if SMTP_SSL else 25))
+        if SMTP_SSL:
+            server = smtplib.SMTP_SSL(host, port, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                server.starttls()
+        if os.getenv("SMTP_PASS"):
+            server.login(os.getenv("SMTP_USER"), os.getenv("SMTP_PASS"))
+        self._server = server
+        self.connects += 1
+
+    def close(self):
+
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+    def close_if_idle(self):
+        if time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def send(self, to_email, message):
+
+        self.close_if_idle()
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.sendmail(_sender(), to_email, message)
+        except smtplib.SMTPServerDisconnected:
+            # Release the dead socket before reconnecting
+            self.close()
+            self._connect()
+            self._server.sendmail(_sender(), to_email, message)
+        self._last_used = time.monotonic()
+
+
+def deliver_email(to_email, subject, body, connection=None):
 
+    # Sends right now on the calling thread; raises on failure
+    if connection is not None:
+        connection.send(to_email, build_message(to_email, subject, body))
+        return
+    connection = SMTPConnection()
     try:
-        smtp_host = os.getenv("SMTP_HOST")
-        smtp_port = os.getenv("SMTP_PORT")
-        smtp_user = os.getenv("SMTP_USER")
-        smtp_pass = os.getenv("SMTP_PASS")
-
-        message = MIMEMultipart()
-        message["From"] = smtp_user
-        message["To"] = to_email
-        message["Subject"] = subject
-        message.attach(MIMEText(body, "html"))
-
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_pass)
-            server.sendmail(smtp_user, to_email, message.as_string())
-            logger.info(green + f"Email sent to {to_email}" + reset)
+        connection.send(to_email, build_message(to_email, subject, body))
+    finally:
+        connection.close()
+
+
+def _is_permanent(error):
+
+    # 5xx answers about the message or recipient will never succeed; a bad
+    # login is a config problem and worth retrying once it is fixed
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and (
+        500 <= error.smtp_code < 600
+    )
+
+
+def _new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _backoff(attempts):
+    delay = min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Moves retries that are due back onto the outbox.
+# KEYS: retry zset, outbox list; ARGV: now, max items
+_PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, message in ipairs(due) do
+    redis.call('ZREM', KEYS[1], message)
+    redis.call('LPUSH', KEYS[2], message)
+end
+return #due
+"""
+
+
+class MailOutbox:
+    # Mail queue persisted in Redis. Producers LPUSH and return; a worker
+    # moves messages onto its own processing list (so a crash never loses
+    # them), sends them in batches over one SMTP connection and schedules
+    # failures for a retry with exponential backoff.
+
+    def __init__(
+        self,
+        client=redis_client,
+        key=MAIL_QUEUE_KEY,
+        batch_size=MAIL_BATCH_SIZE,
+        poll_interval=MAIL_POLL_INTERVAL,
+        max_attempts=MAIL_MAX_ATTEMPTS,
+        connection_factory=SMTPConnection,
+    ):
+        self.client = client
+        self.key = key
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.connection_factory = connection_factory
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._promote = None
+        self.worker_id = None
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    # ---- Producer side --->
+
+    def enqueue(self, to_email, subject, body, sensitive=False):
+
+        # sensitive: the body holds a code or link; it is dropped when the
+        # message is dead-lettered
+        message = {
+            "id": uuid.uuid4().hex,
+            "to": to_email,
+            "subject": subject,
+            "body": body,
+            "attempts": 0,
+            "queued_at": time.time(),
+            "sensitive": sensitive,
+        }
+        self.client.lpush(self.key, json.dumps(message))
+        return message["id"]
+
+    # ---- Worker side --->
+
+    def _processing_key(self):
+        return _PROCESSING_PREFIX + self.worker_id
+
+    def _heartbeat(self):
+
+        # Refreshed before every message, so it only has to outlive one
+        # send: connect, login and sendmail plus one reconnect, each of
+        # which may take up to SMTP_TIMEOUT
+        ttl = max(self.poll_interval * 10, SMTP_TIMEOUT * 4, 10)
+        self.client.set(_ALIVE_PREFIX + self.worker_id, "1", ex=int(ttl))
+
+    def recover(self):
+
+        # Requeue messages held by workers that died mid-batch
+        recovered = 0
+        for processing_key in self.client.scan_iter(match=_PROCESSING_PREFIX + "*"):
+            worker_id = processing_key[len(_PROCESSING_PREFIX) :]
+            if worker_id == self.worker_id or self.client.exists(
+                _ALIVE_PREFIX + worker_id
+            ):
+                continue
+            while self.client.lmove(processing_key, self.key, "RIGHT", "RIGHT"):
+                recovered += 1
+        if recovered:
+            logger.info(blue + f"Recovered {recovered} queued email(s)" + reset)
+        return recovered
+
+    def release_claimed(self):
+
+        # Put back what this worker still holds, e.g. a batch cut short by a
+        # Redis error; recover() only looks at other workers' lists
+        released = 0
+        while self.client.lmove(self._processing_key(), self.key, "RIGHT", "RIGHT"):
+            released += 1
+        if released:
+            logger.info(blue + f"Requeued {released} claimed email(s)" + reset)
+        return released
+
+    def promote_due(self):
+
+        if self._promote is None:
+            self._promote = self.client.register_script(_PROMOTE_DUE)
+        return self._promote(
+            keys=[_RETRY_KEY, self.key], args=[time.time(), self.batch_size * 10]
+        )
+
+    def _claim(self, timeout):
+
+        # Block for the first message, then take the rest of the batch in a
+        # single round trip
+        first = self.client.blmove(
+            self.key, self._processing_key(), timeout, "RIGHT", "LEFT"
+        )
+        if first is None:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for _ in range(self.batch_size - 1):
+            pipe.lmove(self.key, self._processing_key(), "RIGHT", "LEFT")
+        return [first] + [raw for raw in pipe.execute() if raw is not None]
+
+    def _fail(self, pipe, raw, message, error):
+
+        message["attempts"] += 1
+        message["last_error"] = str(error)
+        if _is_permanent(error) or message["attempts"] >= self.max_attempts:
+            if message.get("sensitive"):
+                message["body"] = None
+            pipe.lpush(_DEAD_KEY, json.dumps(message))
+            pipe.ltrim(_DEAD_KEY, 0, MAIL_DEAD_MAX - 1)
+            pipe.expire(_DEAD_KEY, MAIL_DEAD_TTL)
+            self.dead += 1
+            logger.error(
+                red + f"Giving up on email to {message['to']}: {error}" + reset
+            )
+        else:
+            due = time.time() + _backoff(message["attempts"])
+            pipe.zadd(_RETRY_KEY, {json.dumps(message): due})
+            self.retried += 1
+            logger.warning(
+                blue
+                + f"Email to {message['to']} failed (attempt "
+                + f"{message['attempts']}), retrying: {error}"
+                + reset
+            )
+
+    def _send_batch(self, connection, batch):
+
+        # Every message is acked (LREM) or rescheduled in the same MULTI, so
+        # it is never both requeued and left on the processing list
+        for raw in batch:
+            # A batch can outlast the heartbeat; stay visible to recover()
+            self._heartbeat()
+            message = json.loads(raw)
+            pipe = self.client.pipeline(transaction=True)
+            pipe.lrem(self._processing_key(), 1, raw)
+            try:
+                deliver_email(
+                    message["to"], message["subject"], message["body"], connection
+                )
+                self.sent += 1
+                logger.info(green + f"Email sent to {message['to']}" + reset)
+            except Exception as e:
+                connection.close()
+                self._fail(pipe, raw, message, e)
+            pipe.execute()
+
+    def run_once(self, connection, timeout=None):
+
+        self._heartbeat()
+        self.promote_due()
+        batch = self._claim(self.poll_interval if timeout is None else timeout)
+        if batch:
+            self._send_batch(connection, batch)
+        else:
+            connection.close_if_idle()
+        return len(batch)
+
+    def _run(self):
+
+        connection = self.connection_factory()
+        next_recover = 0.0
+        release = False
+        while not self._stop.is_set():
+            try:
+                if release:
+                    self.release_claimed()
+                    release = False
+                if time.monotonic() >= next_recover:
+                    self.recover()
+                    next_recover = time.monotonic() + 60
+                self.run_once(connection)
+            except Exception as e:
+                logger.error(red + f"Mail worker error: {e}" + reset)
+                release = True
+                self._stop.wait(self.poll_interval)
+        connection.close()
+
+    def start(self):
+
+        # (Re)start the worker lazily, also in a forked child
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self.worker_id = _new_worker_id()
+            self._thread = threading.Thread(
+                target=self._run, name="mail-outbox", daemon=True
+            )
+            self._thread.start()
+
+    def run_forever(self):
+
+        # Foreground worker (python -m utils.sendmail --worker)
+        self._pid = os.getpid()
+        self.worker_id = _new_worker_id()
+        logger.info(green + f"Mail worker {self.worker_id} started" + reset)
+        try:
+            self._run()
+        except KeyboardInterrupt:
+            pass
+
+    def close(self, timeout=MAIL_FLUSH_TIMEOUT):
+
+        # Give the worker a moment to send what this process queued, then
+        # stop; anything left stays in Redis for the next worker
+        if self._thread is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and (
+                self.client.llen(self.key) or self.client.llen(self._processing_key())
+            ):
+                time.sleep(0.1)
+        except Exception as e:
+            logger.error(red + f"Failed to drain mail outbox: {e}" + reset)
+        self._stop.set()
+        self._thread.join(self.poll_interval + SMTP_TIMEOUT)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "queued": self.client.llen(self.key),
+            "scheduled_retries": self.client.zcard(_RETRY_KEY),
+            "dead": self.client.llen(_DEAD_KEY),
+            "sent": self.sent,
+            "retried": self.retried,
+            "given_up": self.dead,
+        }
+
+
+mail_outbox = MailOutbox()
+atexit.register(mail_outbox.close)
+
+
+def send_email(to_email, subject, body, sensitive=False):
+
+    # Queue the mail and return; falls back to sending inline when the
+    # outbox is disabled or Redis is unreachable. Pass sensitive=True for
+    # mail carrying codes or links (see MailOutbox.enqueue)
+    if MAIL_OUTBOX:
+        try:
+            mail_outbox.enqueue(to_email, subject, body, sensitive)
+            if MAIL_WORKER_IN_PROCESS:
+                mail_outbox.start()
+            return True
+        except Exception as e:
+            logger.error(red + f"Mail outbox unavailable, sending now: {e}" + reset)
+    try:
+        deliver_email(to_email, subject, body)
+        logger.info(green + f"Email sent to {to_email}" + reset)
+        return True
     except Exception as e:
         logger.error(red + f"Error sending email: {e}" + reset)
+        return False
 
 
 # 2fa is to small to give a sepparate file
@@ -67,4 +473,20 @@ def email_confirmation(email):
         </body>
     </html>
     """,
+        sensitive=True,
     )
+
+
+if __name__ == "__main__":
+    # python -m utils.sendmail --worker            run a dedicated sender
+    # python -m utils.sendmail --stats             show queue sizes
+    # python -m utils.sendmail --test you@host     queue one test message
+    if "--stats" in sys.argv:
+        print(mail_outbox.stats())
+    elif "--test" in sys.argv:
+        to_email = sys.argv[sys.argv.index("--test") + 1]
+        send_email(to_email, "Outbox test", "<p>It works.</p>")
+        mail_outbox.close()
+        print(mail_outbox.stats())
+    else:
+        mail_outbox.run_forever()
@@ -1,55 +1,293 @@
 import os
-import uuid
+import time
+import struct
+import hashlib
+import secrets
+import threading
 import jwt as pyjwt
-from flask import jsonify
-from datetime import datetime, timedelta
-from db.redis_operations import redis_client
-from utils.helpers import green, reset
+from bson import ObjectId
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+from db.redis_operations import redis_client, redis_binary_client
+from db.local_cache import (
+    LocalCache,
+    watch_invalidations,
+    start_invalidation_listener,
+    is_listening,
+    publish_invalidation,
+)
 
 
-SESSION_KEY = os.getenv("SESSION_KEY")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "900"))  # Expires in 15min
+# Validated sessions are trusted locally for this long (0 = always ask Redis).
+# destroy_session() evicts them everywhere over the cache:invalidate channel;
+# a process that is not listening (see start_session_listener) always asks
+# Redis.
+SESSION_LOCAL_TTL = float(os.getenv("SESSION_LOCAL_TTL", "5"))
+
+# Session payload: version, id kind, created (unix secs), user id bytes
+_SESSION_HEADER = struct.Struct("!BBI")
+_SESSION_VERSION = 1
+_ID_OBJECTID = 0
+_ID_TEXT = 1
+
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
+
+JWTResult = namedtuple("JWTResult", "valid claims error")
+
+# Keyed like Redis ("session:<token>") so invalidations apply to it
+_local_sessions = LocalCache(maxsize=10000, ttl=SESSION_LOCAL_TTL or 5)
+watch_invalidations(_local_sessions)
+
+
+def _session_key(session_token):
+    return f"session:{session_token}"
+
+
+def pack_session(user_id) -> bytes:
+
+    # ObjectId user ids fit in 12 bytes instead of 24 hex chars
+    user_id = str(user_id)
+    if ObjectId.is_valid(user_id):
+        kind, raw = _ID_OBJECTID, ObjectId(user_id).binary
+    else:
+        kind, raw = _ID_TEXT, user_id.encode()
+    return _SESSION_HEADER.pack(_SESSION_VERSION, kind, int(time.time())) + raw
+
+
+def unpack_session(payload: bytes) -> dict:
+
+    version, kind, created = _SESSION_HEADER.unpack_from(payload)
+    if version != _SESSION_VERSION:
+        raise ValueError(f"Unsupported session version: {version}")
+    raw = payload[_SESSION_HEADER.size :]
+    user_id = str(ObjectId(raw)) if kind == _ID_OBJECTID else raw.decode()
+    return {"user_id": user_id, "created": created}
 
 
 def create_session(user_id):
 
-    session_token = str(uuid.uuid4())
-    redis_client.set(
-        green + f"session: {session_token}" + reset, user_id, ex=900
-    )  # Expires in 15min
+    session_token = secrets.token_urlsafe(32)
+    redis_binary_client.set(
+        _session_key(session_token), pack_session(user_id), ex=SESSION_TTL
+    )
     return session_token
 
 
-def verify_session(session_token):
+def start_session_listener():
+
+    # Once per process at startup (it blocks on Redis): serve.py's post_fork,
+    # the async backend's before_serving
+    if SESSION_LOCAL_TTL > 0:
+        return start_invalidation_listener(redis_client)
+    return False
+
 
-    user_id = redis_client.expire(green + f"session: {session_token}" + reset)
-    if user_id:
-        redis_client.expire(green + f"session: {session_token}" + reset, 900)
-        return user_id
-    return None
+def _trust_local(use_local_cache):
+
+    if use_local_cache is None:
+        use_local_cache = SESSION_LOCAL_TTL > 0
+    # Without the listener a revoked session would stay valid here
+    return use_local_cache and is_listening()
+
+
+def _session_user(payload):
+
+    if not payload:
+        return None
+    try:
+        return unpack_session(payload)["user_id"]
+    except (ValueError, struct.error):
+        return None
+
+
+def verify_session(session_token, use_local_cache=None):
+
+    use_local_cache = _trust_local(use_local_cache)
+    if use_local_cache:
+        user_id = _local_sessions.get(_session_key(session_token))
+        if user_id is not None:
+            return user_id
+
+    # GETEX reads the session and slides its expiry in one round trip
+    payload = redis_binary_client.getex(_session_key(session_token), ex=SESSION_TTL)
+    user_id = _session_user(payload)
+    if use_local_cache and user_id is not None:
+        _local_sessions.set(_session_key(session_token), user_id)
+    return user_id
+
+
+async def verify_session_async(client, session_token, use_local_cache=None):
+
+    # Same lookup on a redis.asyncio client (decode_responses=False), for the
+    # async backend; shares the local cache with verify_session()
+    use_local_cache = _trust_local(use_local_cache)
+    if use_local_cache:
+        user_id = _local_sessions.get(_session_key(session_token))
+        if user_id is not None:
+            return user_id
+
+    payload = await client.getex(_session_key(session_token), ex=SESSION_TTL)
+    user_id = _session_user(payload)
+    if use_local_cache and user_id is not None:
+        _local_sessions.set(_session_key(session_token), user_id)
+    return user_id
 
 
 def destroy_session(session_token):
 
-    redis_client.delete(green + f"session: {session_token}" + reset)
+    # Delete first, then tell every process to drop its local copy
+    redis_binary_client.delete(_session_key(session_token))
+    publish_invalidation(redis_client, _session_key(session_token))
+
+
+def benchmark_sessions(iterations=1000):
+
+    # Per-request cost (us) of verify_session with and without the local cache
+    token = create_session(str(ObjectId()))
+    results = {}
+    try:
+        for label, use_local_cache in (("redis_only", False), ("local_cache", True)):
+            _local_sessions.clear()
+            started = time.perf_counter()
+            for _ in range(iterations):
+                verify_session(token, use_local_cache=use_local_cache)
+            elapsed = time.perf_counter() - started
+            results[label] = round(elapsed / iterations * 1e6, 2)
+    finally:
+        destroy_session(token)
+    return results
+
+
+class JWTVerifier:
+    # Signs and verifies HS256 tokens for several keys (picked by the "kid"
+    # header) and remembers already verified tokens until they expire, so a
+    # hot path doesn't redo the HMAC and JSON decoding on every request.
+
+    def __init__(self, keys, active_kid, cache_size=JWT_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+        self.set_keys(keys, active_kid)
+
+    @classmethod
+    def from_env(cls):
+
+        # JWT_KEYS="kid1:secret1,kid2:secret2", falls back to SESSION_KEY
+        keys = {}
+        for entry in filter(None, os.getenv("JWT_KEYS", "").split(",")):
+            kid, _, secret = entry.strip().partition(":")
+            keys[kid] = secret
+        if not keys and os.getenv("SESSION_KEY"):
+            keys["default"] = os.getenv("SESSION_KEY")
+        active_kid = os.getenv("JWT_ACTIVE_KID") or next(iter(keys), None)
+        return cls(keys, active_kid)
+
+    def set_keys(self, keys, active_kid):
+
+        # Rotation: add the new key, make it active, drop the old one once
+        # its tokens have expired. Cached results for removed keys are dropped.
+        if active_kid not in keys:
+            raise ValueError(f"Active key id '{active_kid}' has no key")
+        with self._lock:
+            self.keys = dict(keys)
+            self.active_kid = active_kid
+            for digest in [
+                d for d, entry in self._cache.items() if entry[0] not in self.keys
+            ]:
+                del self._cache[digest]
+
+    def sign(self, claims, expires_in=900):
+
+        now = datetime.now(timezone.utc)
+        payload = {**claims, "iat": now, "exp": now + timedelta(seconds=expires_in)}
+        return pyjwt.encode(
+            payload,
+            self.keys[self.active_kid],
+            algorithm="HS256",
+            headers={"kid": self.active_kid},
+        )
+
+    def _cached(self, digest):
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is None:
+                return None
+            kid, claims = entry
+            if kid not in self.keys or claims["exp"] <= time.time():
+                del self._cache[digest]
+                return None
+            self._cache.move_to_end(digest)
+            return claims
+
+    def _remember(self, digest, kid, claims):
+        with self._lock:
+            self._cache[digest] = (kid, claims)
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def verify(self, token):
+
+        if not token:
+            return JWTResult(False, None, "missing")
+        if isinstance(token, str):
+            token = token.encode()
+        digest = hashlib.sha256(token).digest()
+        claims = self._cached(digest)
+        if claims is not None:
+            return JWTResult(True, dict(claims), None)
+
+        try:
+            kid = pyjwt.get_unverified_header(token).get("kid", "default")
+            key = self.keys.get(kid)
+            if key is None:
+                return JWTResult(False, None, "unknown_key")
+            claims = pyjwt.decode(
+                token, key, algorithms=["HS256"], options={"require": ["exp"]}
+            )
+        except pyjwt.ExpiredSignatureError:
+            return JWTResult(False, None, "expired")
+        except pyjwt.InvalidTokenError:
+            return JWTResult(False, None, "invalid")
+
+        self._remember(digest, kid, claims)
+        return JWTResult(True, dict(claims), None)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_jwt_verifier = None
+_jwt_verifier_lock = threading.Lock()
+
+
+def get_jwt_verifier():
+
+    # Built on first use so keys are read after the environment is loaded
+    global _jwt_verifier
+    if _jwt_verifier is None:
+        with _jwt_verifier_lock:
+            if _jwt_verifier is None:
+                _jwt_verifier = JWTVerifier.from_env()
+    return _jwt_verifier
 
 
 def create_jwt(user_id, email):
 
-    payload = {
-        "user_id": user_id,
-        "email": email,
-        "exp": datetime.now() + timedelta(seconds=900),  # Expiration time
-        "iat": datetime.now(),
-    }
-    token = pyjwt.encode(payload, SESSION_KEY, algorithm="HS256")
-    return token
+    return get_jwt_verifier().sign({"user_id": user_id, "email": email}, 900)
 
 
 def verify_jwt(token):
 
-    try:
-        decoded_token = pyjwt.decode(token, SESSION_KEY, algorithms=["HS256"])
-    except pyjwt.ExpiredSignatureError:
-        return jsonify({"success": False, "message": "Token has expired."}), 401
-    except pyjwt.InvalidTokenError:
-        return jsonify({"success": False, "message": "Invalid token."}), 401
+    # JWTResult(valid, claims, error); error is "expired", "invalid", ...
+    return get_jwt_verifier().verify(token)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--bench" in sys.argv:
+        for label, micros in benchmark_sessions().items():
+            print(f"verify_session [{label}]: {micros} us/request")
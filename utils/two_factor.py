@@ -0,0 +1,187 @@
+# Email 2FA codes kept in Redis: only an HMAC of the code is stored, and a
+# guess is checked, counted and (on success) consumed in one Lua call.
+import os
+import hmac
+import hashlib
+import secrets
+import logging
+from collections import namedtuple
+from dotenv import load_dotenv
+from connection.connect_redis import redis_client
+from utils.rate_limit import check_rate_limit
+from utils.sendmail import send_email
+from db.audit import log_audit_event
+from utils.helpers import red, reset
+
+load_dotenv()
+
+TWO_FACTOR_TTL = int(os.getenv("TWO_FACTOR_TTL", "300"))
+TWO_FACTOR_MAX_ATTEMPTS = int(os.getenv("TWO_FACTOR_MAX_ATTEMPTS", "5"))
+# Codes that may be requested per email within TWO_FACTOR_TTL
+TWO_FACTOR_SEND_LIMIT = int(os.getenv("TWO_FACTOR_SEND_LIMIT", "3"))
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# error: None, "invalid", "expired" (no pending code), "locked" (too many
+# wrong guesses) or "unavailable" (Redis down)
+TwoFactorResult = namedtuple("TwoFactorResult", "valid attempts_left error")
+# error: None, "rate_limited" or "unavailable" (code not stored / not queued)
+SendCodeResult = namedtuple("SendCodeResult", "sent error")
+
+# KEYS[1] code key; ARGV: code hash, max attempts
+# Returns {1, 0} on success, {0, attempts left} on a wrong code, {-1, 0}
+# when nothing is pending and {-2, 0} once the last attempt is used up.
+_VERIFY = """
+local stored = redis.call('HMGET', KEYS[1], 'hash', 'attempts')
+if not stored[1] then
+    return {-1, 0}
+end
+if stored[1] == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return {1, 0}
+end
+local attempts = tonumber(stored[2]) + 1
+local left = tonumber(ARGV[2]) - attempts
+if left <= 0 then
+    redis.call('DEL', KEYS[1])
+    return {-2, 0}
+end
+redis.call('HSET', KEYS[1], 'attempts', attempts)
+return {0, left}
+"""
+
+_STATUS = {1: None, 0: "invalid", -1: "expired", -2: "locked"}
+_verify_script = None
+
+
+def _code_key(email):
+    return "2fa:" + hashlib.sha256(email.lower().encode()).hexdigest()
+
+
+def _hash_code(email, code):
+
+    # Keyed so a dump of Redis does not give away six-digit codes by brute force
+    secret = (os.getenv("SECRET_KEY") or "").encode()
+    message = f"{email.lower()}:{str(code).strip()}".encode()
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def _result(raw):
+    status, left = (int(value) for value in raw)
+    return TwoFactorResult(status == 1, left, _STATUS[status])
+
+
+def generate_code():
+    return f"{secrets.randbelow(900000) + 100000}"
+
+
+def store_code(email, code, ttl=TWO_FACTOR_TTL):
+
+    # A new code replaces the pending one and resets its attempts
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(_code_key(email))
+    pipe.hset(
+        _code_key(email), mapping={"hash": _hash_code(email, code), "attempts": 0}
+    )
+    pipe.expire(_code_key(email), ttl)
+    pipe.execute()
+
+
+def send_code(email):
+
+    # SendCodeResult(sent, error); sent once a code is stored and queued
+    if not check_rate_limit(
+        f"2fa-send:{email.lower()}", limit=TWO_FACTOR_SEND_LIMIT, window=TWO_FACTOR_TTL
+    ).allowed:
+        return SendCodeResult(False, "rate_limited")
+    code = generate_code()
+    try:
+        store_code(email, code)
+    except Exception as e:
+        logger.error(red + f"Failed to store 2FA code: {e}" + reset)
+        return SendCodeResult(False, "unavailable")
+    sent = send_email(
+        to_email=email,
+        subject="Your 2FA Code",
+        body=f"Your 2FA code is {code} Please enter it to complete the login process.",
+        sensitive=True,
+    )
+    log_audit_event(
+        user_id=email,
+        email=email,
+        action="2FA Code Sent" if sent else "2FA Code Sending Failed",
+        details={"expires_in": TWO_FACTOR_TTL},
+    )
+    return SendCodeResult(sent, None if sent else "unavailable")
+
+
+def verify_code(email, code):
+
+    global _verify_script
+    if not code:
+        return TwoFactorResult(False, 0, "invalid")
+    try:
+        if _verify_script is None:
+            _verify_script = redis_client.register_script(_VERIFY)
+        raw = _verify_script(
+            keys=[_code_key(email)],
+            args=[_hash_code(email, code), TWO_FACTOR_MAX_ATTEMPTS],
+        )
+        return _result(raw)
+    except Exception as e:
+        logger.error(red + f"2FA verification failed: {e}" + reset)
+        return TwoFactorResult(False, 0, "unavailable")
+
+
+def send_code_reply(result):
+
+    # (JSON body, HTTP status) for the /send-2fa endpoints
+    if result.sent:
+        return {"success": True, "message": "2FA code sent successfully"}, 200
+    if result.error == "rate_limited":
+        message = "Too many 2FA codes requested. Try again later."
+        return {"success": False, "message": message}, 429
+    return {"success": False, "message": "Failed to send 2FA code"}, 503
+
+
+def two_factor_reply(result):
+
+    # (JSON body, HTTP status) for the /verify-2fa endpoints
+    if result.valid:
+        return {"success": True, "message": "2FA code verified"}, 200
+    if result.error == "unavailable":
+        return {"success": False, "message": "Server error occurred"}, 503
+    if result.error == "locked":
+        message = "Too many attempts. Request a new code."
+        return {"success": False, "message": message}, 429
+    if result.error == "expired":
+        message = "No valid 2FA code, request a new one"
+        return {"success": False, "message": message}, 401
+    return (
+        {
+            "success": False,
+            "message": "Invalid 2FA code",
+            "attempts_left": result.attempts_left,
+        },
+        401,
+    )
+
+
+async def verify_code_async(client, email, code):
+
+    # Same check on a redis.asyncio client, for the async backend
+    if not code:
+        return TwoFactorResult(False, 0, "invalid")
+    try:
+        script = client.register_script(_VERIFY)
+        raw = await script(
+            keys=[_code_key(email)],
+            args=[_hash_code(email, code), TWO_FACTOR_MAX_ATTEMPTS],
+        )
+        return _result(raw)
+    except Exception as e:
+        logger.error(red + f"2FA verification failed: {e}" + reset)
+        return TwoFactorResult(False, 0, "unavailable")
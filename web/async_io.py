@@ -0,0 +1,68 @@
+# Non-blocking I/O for web/handlers.py, used by the Quart backend:
+# Motor for MongoDB, redis.asyncio for Redis, threads for the rest
+import asyncio
+from connection.connect_db import AUDIT_SORT
+from connection.connect_async import get_async_collection, get_async_redis
+from db.audit import audit_page_query, audit_page
+from db.db_operations import invalidate_cache
+from utils.session import verify_session_async
+from utils.rate_limit import check_rate_limit_async
+from utils.two_factor import send_code, verify_code_async
+from login.reset_pass import reset_password
+
+
+class AsyncIO:
+
+    async def find_admin(self, email):
+        return await get_async_collection("admin").find_one(
+            {"email": email}, {"email": 1}
+        )
+
+    async def find_admin_by_id(self, admin_id):
+        return await get_async_collection("admin").find_one(
+            {"_id": admin_id}, {"email": 1}
+        )
+
+    async def verify_session(self, session_token):
+        return await verify_session_async(
+            get_async_redis(decode_responses=False), session_token
+        )
+
+    async def send_code(self, email):
+        # Storing the code and queueing the mail are sync Redis calls
+        return await asyncio.to_thread(send_code, email)
+
+    async def verify_code(self, email, code):
+        return await verify_code_async(get_async_redis(), email, code)
+
+    async def reset_password(self, token, new_password):
+        # bcrypt is CPU bound; keep it off the event loop
+        return await asyncio.to_thread(reset_password, token, new_password)
+
+    async def unlock_account(self, email):
+        try:
+            await get_async_collection("admin").update_one(
+                {"email": email}, {"$set": {"account_locked": False}}
+            )
+        except Exception as e:
+            message = f"Failed to Unlock the account: {str(e)}"
+            return {"success": False, "message": message}
+        # Keep cached admin queries coherent with the sync code path
+        await asyncio.to_thread(invalidate_cache, "admin")
+        return {"success": True, "message": "Account unlocked successfully"}
+
+    async def audit_logs(self, limit=50, **filters):
+        query, projection = audit_page_query(**filters)
+        cursor = (
+            get_async_collection("audit_log")
+            .find(query, projection)
+            .sort(AUDIT_SORT)
+            .limit(limit + 1)
+        )
+        return audit_page(await cursor.to_list(length=limit + 1), limit)
+
+    async def check_rate_limit(self, key, limit, window):
+        return await check_rate_limit_async(get_async_redis(), key, limit, window)
+
+
+async_io = AsyncIO()
@@ -0,0 +1,188 @@
+# Route logic shared by backend.py (Flask) and backend_async.py (Quart).
+#
+# Handlers are coroutines that do all their I/O through an adapter: SyncIO
+# (web/sync_io.py) wraps the blocking helpers and is driven with run_sync(),
+# AsyncIO (web/async_io.py) uses Motor and redis.asyncio. Both backends
+# register ROUTES, so a fix here lands in both.
+#
+# A handler returns (body, status, headers); body is JSON-serializable.
+from collections import namedtuple
+from bson.objectid import ObjectId
+from db.audit import audit_query_from_args, serialize_audit_log
+from utils.two_factor import send_code_reply, two_factor_reply
+from utils.sendmail import confirm_token
+from login.reset_pass import confirm_reset_token
+from login.unlock_account import confirm_unlock_token
+
+# json: parsed body ({} when absent); args / headers: mappings
+WebRequest = namedtuple("WebRequest", "method json args headers")
+
+LOGIN_RATE_LIMIT = 5
+LOGIN_RATE_WINDOW = 300
+
+
+def _reply(body, status=200, headers=None):
+    return body, status, headers or {}
+
+
+def _fail(message, status):
+    return _reply({"success": False, "message": message}, status)
+
+
+def run_sync(coro):
+
+    # Runs a handler on the calling thread. With SyncIO nothing ever
+    # suspends, so the first send() runs it to completion
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("Handler awaited async I/O; use it with AsyncIO")
+
+
+async def confirm_2fa_email(io, req, token):
+
+    email = confirm_token(token)
+    if not email:
+        return _fail("Invalid or expired token", 400)
+    return _reply({"success": True, "message": "Email confirmed!", "email": email})
+
+
+async def send_2fa(io, req):
+
+    email = req.json.get("email")
+    if not email:
+        return _fail("Email is required", 400)
+
+    if not await io.find_admin(email):
+        return _fail("User not found", 404)
+
+    # The code only travels by email; the client never sees it
+    return _reply(*send_code_reply(await io.send_code(email)))
+
+
+async def verify_2fa(io, req):
+
+    email = req.json.get("email")
+    code = req.json.get("code")
+    if not email or not code:
+        return _fail("Both email and code are required", 400)
+
+    return _reply(*two_factor_reply(await io.verify_code(email, code)))
+
+
+async def reset_password(io, req, token):
+
+    if req.method == "GET":
+        email = confirm_reset_token(token, salt="password-reset-salt", expiration=600)
+        if not email:
+            return _fail("Invalid or expired token", 400)
+        return _reply(
+            {
+                "success": True,
+                "message": "Token is valid. Please submit your new password.",
+                "email": email,
+                "code": token,
+            }
+        )
+
+    new_password = req.json.get("new_password")
+    if not new_password:
+        return _fail("New password is required", 400)
+
+    # Validate the token again in case of tampering
+    if not confirm_reset_token(token, salt="password-reset-salt"):
+        return _fail("Invalid or expired token", 400)
+
+    response = await io.reset_password(token, new_password)
+    return _reply(response, 200 if response["success"] else 400)
+
+
+async def unlock_account(io, req, token):
+
+    email = confirm_unlock_token(token, salt="unlock-account-salt")
+    if not email:
+        return _fail("Invalid or expired token", 400)
+
+    if req.method == "GET":
+        return _reply(
+            {
+                "success": True,
+                "message": "Token is valid. Please confirm account unlocking.",
+                "code": token,
+            }
+        )
+
+    try:
+        if not await io.find_admin(email):
+            return _fail("User not found", 404)
+        response = await io.unlock_account(email)
+    except Exception:
+        return _fail("Server error occurred", 500)
+    return _reply(response, 200 if response["success"] else 400)
+
+
+async def protected(io, req):
+
+    session_token = req.headers.get("Authorization")
+    if not session_token:
+        return _fail("Unauthorized", 401)
+
+    user_id = await io.verify_session(session_token)
+    if not user_id:
+        return _fail("Session expired or invalid", 401)
+
+    user = await io.find_admin_by_id(ObjectId(user_id))
+    if not user:
+        return _fail("User not found", 404)
+
+    return _reply({"success": True, "message": f"Welcome, {user['email']}!"})
+
+
+async def audit_logs(io, req):
+
+    session_token = req.headers.get("Authorization")
+    if not session_token or not await io.verify_session(session_token):
+        return _fail("Unauthorized", 401)
+
+    # Bad dates, limits and cursors all surface as ValueError
+    try:
+        page = await io.audit_logs(**audit_query_from_args(req.args))
+    except ValueError as e:
+        return _fail(str(e), 400)
+
+    logs = [serialize_audit_log(log) for log in page["logs"]]
+    return _reply({"success": True, "logs": logs, "next_cursor": page["next_cursor"]})
+
+
+async def rate_limited_login(io, req):
+
+    email = req.json.get("email")
+    if not email:
+        return _fail("Email is required", 400)
+
+    result = await io.check_rate_limit(
+        f"login:{email}", LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW
+    )
+    if not result.allowed:
+        return _reply(
+            {"success": False, "message": "Too many attempts. Try again later."},
+            429,
+            {"Retry-After": str(max(1, round(result.retry_after)))},
+        )
+
+    return _reply({"success": True, "message": "Login attempt allowed"})
+
+
+# (rule, methods, handler) registered by both backends
+ROUTES = [
+    ("/confirm/2fa/<token>", ["GET"], confirm_2fa_email),
+    ("/send-2fa", ["POST"], send_2fa),
+    ("/verify-2fa", ["POST"], verify_2fa),
+    ("/reset-password/<token>", ["GET", "POST"], reset_password),
+    ("/unlock-account/<token>", ["GET", "POST"], unlock_account),
+    ("/protected", ["GET"], protected),
+    ("/audit-logs", ["GET"], audit_logs),
+    ("/rate-limited-login", ["GET"], rate_limited_login),
+]
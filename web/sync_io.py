@@ -0,0 +1,47 @@
+# Blocking I/O for web/handlers.py, used by the Flask backend
+from db.db_operations import find_documents
+from db.audit import get_audit_logs
+from utils.session import verify_session
+from utils.rate_limit import check_rate_limit
+from utils.two_factor import send_code, verify_code
+from login.reset_pass import reset_password
+from login.unlock_account import unlock_admin
+
+
+def _first(documents):
+    return documents[0] if documents else None
+
+
+class SyncIO:
+    # Methods are coroutines so the handlers can await them, but none of
+    # them ever suspends: run_sync() finishes a handler in one step.
+
+    async def find_admin(self, email):
+        return _first(find_documents("admin", {"email": email}))
+
+    async def find_admin_by_id(self, admin_id):
+        return _first(find_documents("admin", {"_id": admin_id}))
+
+    async def verify_session(self, session_token):
+        return verify_session(session_token)
+
+    async def send_code(self, email):
+        return send_code(email)
+
+    async def verify_code(self, email, code):
+        return verify_code(email, code)
+
+    async def reset_password(self, token, new_password):
+        return reset_password(token, new_password)
+
+    async def unlock_account(self, email):
+        return unlock_admin(email)
+
+    async def audit_logs(self, **query):
+        return get_audit_logs(**query)
+
+    async def check_rate_limit(self, key, limit, window):
+        return check_rate_limit(key, limit, window)
+
+
+sync_io = SyncIO()